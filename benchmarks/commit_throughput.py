@@ -0,0 +1,86 @@
+"""
+Measure how many tile-sized files per second each output commit policy can write, against a direct write with a mkdir per file. ImageMagick is not called; each "tile" is a block of random bytes, so this isolates the cost of directory creation, renames and fsync on the target filesystem.
+
+    PYTHONPATH=. python benchmarks/commit_throughput.py /path/on/target/volume --tiles 2000
+"""
+
+import os
+import shutil
+from functools import partial
+from pathlib import Path
+from tempfile import mkdtemp
+from time import perf_counter
+from typing import Callable
+
+import typer
+
+from magick_tile.committer import OutputCommitter
+from magick_tile.planner import tile_regions
+from magick_tile.settings import FsyncPolicies
+
+
+def tile_files(target_dir: Path, tiles: int, tile_size: int) -> list[Path]:
+    """Lay out at least `tiles` tile paths the way a single scaling factor would"""
+    side = tile_size
+    while len(tile_regions(side, side, tile_size, 1)) < tiles:
+        side *= 2
+    regions = tile_regions(side, side, tile_size, 1)[:tiles]
+    return [target_dir / r.path / "default.jpg" for r in regions]
+
+
+def direct(files: list[Path], data: bytes) -> None:
+    for f in files:
+        f.parent.mkdir(parents=True, exist_ok=True)
+        f.write_bytes(data)
+
+
+def committed(
+    files: list[Path], data: bytes, fsync: FsyncPolicies, levels: int
+) -> None:
+    """Write the files through a committer, flushing after each of `levels` equal batches as a conversion does after each level"""
+    c = OutputCommitter(fsync=fsync)
+    c.prepare({f.parent for f in files})
+    level_size = max(len(files) // levels, 1)
+    for i, f in enumerate(files, start=1):
+        c.temp_path(f).write_bytes(data)
+        c.commit(f)
+        if i % level_size == 0:
+            c.flush()
+    c.flush()
+
+
+def main(
+    volume: Path = typer.Argument(
+        ..., exists=True, file_okay=False, help="Directory on the volume to test"
+    ),
+    tiles: int = typer.Option(default=1000, help="Files written per run"),
+    tile_bytes: int = typer.Option(default=20_000, help="Size of each file"),
+    tile_size: int = typer.Option(default=256),
+    levels: int = typer.Option(
+        default=4, help="Batches the files are split into, as per scaling factor"
+    ),
+):
+    data = os.urandom(tile_bytes)
+    runs: dict[str, Callable[[list[Path]], None]] = {
+        "direct": partial(direct, data=data),
+        **{
+            f"commit-{policy.value}": partial(
+                committed, data=data, fsync=policy, levels=levels
+            )
+            for policy in FsyncPolicies
+        },
+    }
+    for name, run in runs.items():
+        target_dir = Path(mkdtemp(dir=volume))
+        try:
+            files = tile_files(target_dir, tiles, tile_size)
+            start = perf_counter()
+            run(files)
+            elapsed = perf_counter() - start
+        finally:
+            shutil.rmtree(target_dir)
+        typer.echo(f"{name:>14}: {len(files) / elapsed:10.0f} files/s")
+
+
+if __name__ == "__main__":
+    typer.run(main)
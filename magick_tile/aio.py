@@ -0,0 +1,98 @@
+"""
+Asyncio helpers for running ImageMagick commands without blocking an event loop.
+"""
+
+import asyncio
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Callable, Coroutine, Optional, TypeVar
+
+from pydantic import BaseModel
+
+
+class ProgressEvent(BaseModel):
+    stage: str
+    completed: int
+    total: int
+
+
+T = TypeVar("T")
+
+
+def run_sync(coro: Coroutine[Any, Any, T]) -> T:
+    """
+    Run a coroutine to completion from synchronous code. When the calling thread already runs an event loop, e.g. in a notebook, the coroutine gets its own loop in a worker thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
+async def run_thread(func: Callable[..., T], *args: Any) -> T:
+    """
+    Run a blocking function in a worker thread. A thread cannot be interrupted, so if the awaiting task is cancelled, the cancellation only propagates once the function has returned; cleanup that follows never races with it.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        raise
+
+
+async def run_command(
+    cmd: list[str | Path],
+    semaphore: Optional[asyncio.Semaphore] = None,
+    limit: Optional[asyncio.Semaphore] = None,
+) -> None:
+    """
+    Run a command as a child process, holding the semaphore while it runs. `limit` is acquired first, so that commands waiting on a stage's own limit do not occupy a shared semaphore. If the awaiting task is cancelled, the child is killed and reaped before the cancellation propagates.
+    """
+    async with limit or nullcontext(), semaphore or nullcontext():
+        proc = await asyncio.create_subprocess_exec(
+            *[str(c) for c in cmd],
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await proc.communicate()
+        except asyncio.CancelledError:
+            proc.kill()
+            await proc.wait()
+            raise
+        if proc.returncode:
+            raise subprocess.CalledProcessError(
+                proc.returncode, cmd, output=stdout, stderr=stderr
+            )
+
+
+async def run_stage(
+    stage: str,
+    commands: list[list[str | Path]],
+    semaphore: Optional[asyncio.Semaphore] = None,
+    events: Optional[asyncio.Queue] = None,
+    concurrency: Optional[int] = None,
+) -> None:
+    """
+    Run a batch of independent commands concurrently, at most `concurrency` at a time when given, reporting a ProgressEvent on `events` as each one finishes. If any command fails, or the stage is cancelled, the remaining commands are cancelled and their processes killed.
+    """
+    limit = asyncio.Semaphore(concurrency) if concurrency else None
+    tasks = [
+        asyncio.create_task(run_command(cmd, semaphore, limit)) for cmd in commands
+    ]
+    try:
+        for completed, task in enumerate(asyncio.as_completed(tasks), start=1):
+            await task
+            if events is not None:
+                events.put_nowait(
+                    ProgressEvent(stage=stage, completed=completed, total=len(tasks))
+                )
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
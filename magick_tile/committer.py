@@ -0,0 +1,111 @@
+"""
+Make output files appear atomically: create the directory skeleton once, have ImageMagick write to a temporary name, then rename it into place with the requested durability.
+"""
+
+import ctypes
+import os
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from pydantic import BaseModel
+
+from magick_tile.settings import settings, FsyncPolicies
+
+
+def fsync_path(path: Path) -> None:
+    """Flush a file, or a directory's entries, to stable storage"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+_syncfs: Optional[Callable[[int], int]]
+try:
+    _syncfs = ctypes.CDLL(None, use_errno=True).syncfs
+except (AttributeError, OSError):
+    _syncfs = None
+
+
+def sync_filesystem(path: Path) -> None:
+    """Flush all dirty data and metadata on the filesystem holding `path`, with syncfs(2) where available and sync(2) elsewhere"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if _syncfs is None or _syncfs(fd) != 0:
+            os.sync()
+    finally:
+        os.close(fd)
+
+
+class OutputCommitter(BaseModel):
+    """
+    Commits files according to an fsync policy:
+
+    - none: rename into place as soon as the file is written, leaving flushing to the operating system
+    - level: hold renames until flush(), then sync the filesystem once, rename the whole batch and sync once more to persist the renames. Two syncs per level replace two fsyncs per file.
+    - file: fsync each file, rename it and fsync its directory as soon as it is written
+    """
+
+    fsync: FsyncPolicies = settings.FSYNC_POLICY
+    directories: set[Path] = set()
+    writing: set[Path] = set()
+    pending: list[Path] = []
+
+    def prepare(self, directories: Iterable[Path]) -> None:
+        """Create any directories not already known to exist, each with a single mkdir"""
+        for d in sorted(set(directories) - self.directories):
+            d.mkdir(parents=True, exist_ok=True)
+            self.directories.add(d)
+
+    def temp_path(self, final: Path) -> Path:
+        """
+        Hidden name next to the final file for ImageMagick to write to. It keeps the final extension, from which ImageMagick picks the output format.
+        """
+        temp = final.with_name(f".{os.getpid()}.{final.name}")
+        self.writing.add(temp)
+        return temp
+
+    def commit(self, final: Path) -> None:
+        """Move a finished temporary file into place"""
+        temp = self.temp_path(final)
+        if self.fsync == FsyncPolicies.level:
+            self.pending.append(final)
+            return
+        if self.fsync == FsyncPolicies.file:
+            fsync_path(temp)
+        os.replace(temp, final)
+        self.writing.discard(temp)
+        if self.fsync == FsyncPolicies.file:
+            fsync_path(final.parent)
+
+    def write_text(self, final: Path, text: str) -> None:
+        """Write a small file, such as info.json or an index, through a temporary name and commit it straight away"""
+        self.prepare([final.parent])
+        self.temp_path(final).write_text(text)
+        self.commit(final)
+        self.flush()
+
+    def flush(self) -> None:
+        """Commit every file held back by the level policy"""
+        if not self.pending:
+            return
+        filesystems = {
+            os.stat(final.parent).st_dev: final.parent for final in self.pending
+        }
+        for d in filesystems.values():
+            sync_filesystem(d)
+        for final in self.pending:
+            temp = self.temp_path(final)
+            os.replace(temp, final)
+            self.writing.discard(temp)
+        for d in filesystems.values():
+            sync_filesystem(d)
+        self.pending = []
+
+    def discard(self) -> None:
+        """Remove temporary files that were never committed, e.g. after a failed conversion"""
+        for temp in list(self.writing):
+            temp.unlink(missing_ok=True)
+        self.writing = set()
+        self.pending = []
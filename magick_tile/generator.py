@@ -2,20 +2,46 @@
 This takes inspiration heavily from https://github.com/zimeon/iiif/blob/master/iiif_static.py
 """
 
+import asyncio
 import logging
-from typing import Optional
+import os
+from contextlib import suppress
+from typing import AsyncIterator, Callable, Literal, Optional
 import re
 import subprocess
-from math import floor, ceil
-from tempfile import mkdtemp
+from time import perf_counter
+from math import ceil
 from pathlib import Path
 from itertools import product
 
 from pydantic import BaseModel, Field, HttpUrl
-from rich.progress import track
-
-from magick_tile.settings import settings, IIIFFormats, IIIFVersions
+from rich.progress import Progress, TaskID
+
+from magick_tile.settings import (
+    settings,
+    IIIFFormats,
+    IIIFVersions,
+    ConversionOrders,
+    OutputModes,
+    TiffCompressions,
+)
+from magick_tile.aio import ProgressEvent, run_stage, run_sync, run_thread
+from magick_tile.committer import OutputCommitter
 from magick_tile.manifest import IIIFManifest, TileSize, TileScale
+from magick_tile.planner import (
+    ConversionPlan,
+    Coefficients,
+    TileRegion,
+    batches,
+    tile_regions,
+)
+from magick_tile.scratch import ScratchSpace, scratch_dir, terminate_as_exit
+from magick_tile.updater import Rectangle, SignatureIndex, dirty_tiles
+from magick_tile.verifier import (
+    find_pyramid,
+    update_checksum_index,
+    write_checksum_index,
+)
 
 
 class Dimensions(BaseModel):
@@ -61,50 +87,113 @@ class Tile(BaseModel):
         return self.parsed_filename[5]
 
     @property
-    def file_w(self) -> int:
-        return (
-            ceil(self.w / self.sf)
-            if self.w < self.source_image.tile_size * self.sf
-            else self.source_image.tile_size
+    def region(self) -> TileRegion:
+        return TileRegion(
+            sf=self.sf,
+            x=self.x,
+            y=self.y,
+            w=self.w,
+            h=self.h,
+            tile_size=self.source_image.tile_size,
         )
 
+    @property
+    def file_w(self) -> int:
+        return self.region.file_w
+
     @property
     def file_h(self) -> int:
-        return (
-            floor(self.h / self.sf)
-            if self.h < self.source_image.tile_size * self.sf
-            else self.source_image.tile_size
-        )
+        return self.region.file_h
 
     @property
     def target_dir(self) -> Path:
-        return (
-            self.source_image.target_dir
-            / f"{self.x},{self.y},{self.w},{self.h}"
-            / f"{self.file_w},/0"
-        )
+        return self.source_image.target_dir / self.region.path
 
     @property
     def target_file(self) -> Path:
         return self.target_dir / f"default.{self.format.value}"
 
-    def resize(self) -> None:
-        """Call imagemagick to convert the cropped fullsized tiles to their scaled-down versions, writing it to the final target folder specified by the user."""
-        self.target_dir.mkdir(parents=True, exist_ok=True)
-        cmd: list[str | Path] = [
+    @property
+    def resize_command(self) -> list[str | Path]:
+        return [
             "convert",
             self.original_path,
             "-resize",
             f"{self.file_w}x{self.file_h}",
-            self.target_file,
+            self.source_image.committer.temp_path(self.target_file),
         ]
+
+    def resize(self) -> None:
+        """Call imagemagick to convert the cropped fullsized tiles to their scaled-down versions, writing it to the final target folder specified by the user."""
+        self.source_image.committer.prepare([self.target_dir])
+        cmd = self.resize_command
         logging.debug(f"Resize command: {cmd}")
         subprocess.run(cmd, capture_output=True, check=True)
+        self.source_image.committer.commit(self.target_file)
+
+
+def directory_size(path: Path) -> tuple[int, int]:
+    """Return the total size in bytes and the number of files found beneath a directory"""
+    total_bytes = 0
+    total_files = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            total_bytes += os.stat(os.path.join(root, f)).st_size
+            total_files += 1
+    return total_bytes, total_files
+
+
+class ConversionReport(BaseModel):
+    output_mode: OutputModes
+    elapsed: float
+    output_bytes: int
+    output_files: int
+
+    def __str__(self) -> str:
+        return f"{self.output_mode.value}: wrote {self.output_files} files ({self.output_bytes} bytes) in {self.elapsed:.2f}s"
 
 
 def tempdir_path() -> Path:
-    """Method to return a temp directory Path that can be supplied for SourceImage's working_dir field default_factory"""
-    return Path(mkdtemp())
+    """Method to return a temp directory Path that can be supplied for SourceImage's working_dir field default_factory. It is created in settings.SCRATCH_DIR when that is set, and removed once a conversion finishes."""
+    return scratch_dir()
+
+
+class ConversionLevel(BaseModel):
+    """One unit of progressive output: info.json, a reduced size, or all tiles at a scaling factor"""
+
+    kind: Literal["info", "size", "tiles"]
+    value: int = 0
+    elapsed: float = 0.0
+
+    def __str__(self) -> str:
+        name = {
+            "info": "info.json",
+            "size": f"size {self.value}",
+            "tiles": f"tiles at scale factor {self.value}",
+        }[self.kind]
+        return f"{name} ready after {self.elapsed:.2f}s"
+
+
+def report_level(
+    level: ConversionLevel,
+    start: float,
+    on_level: Optional[Callable[[ConversionLevel], None]],
+) -> None:
+    level.elapsed = perf_counter() - start
+    if on_level is not None:
+        on_level(level)
+
+
+class UpdateReport(BaseModel):
+    changed_cells: int
+    tiles: dict[int, int]
+    elapsed: float
+
+    def __str__(self) -> str:
+        regenerated = ", ".join(
+            f"{n} at scale factor {sf}" for sf, n in self.tiles.items()
+        )
+        return f"{self.changed_cells} changed cells; regenerated tiles: {regenerated or 'none'} in {self.elapsed:.2f}s"
 
 
 class DownsizedVersion(BaseModel):
@@ -120,20 +209,24 @@ class DownsizedVersion(BaseModel):
     def target_file(self) -> Path:
         return self.target_directory / f"default.{self.format.value}"
 
-    def convert(self) -> None:
-        self.target_directory.mkdir(parents=True, exist_ok=True)
-        cmd: list[str | Path] = [
+    @property
+    def command(self) -> list[str | Path]:
+        return [
             "convert",
             self.source_image.path,
             "-geometry",
             f"{self.downsize_width}x",
-            self.target_file,
+            self.source_image.committer.temp_path(self.target_file),
         ]
+
+    def convert(self) -> None:
+        self.source_image.committer.prepare([self.target_directory])
         subprocess.run(
-            cmd,
+            self.command,
             stdout=subprocess.PIPE,
             check=True,
         )
+        self.source_image.committer.commit(self.target_file)
 
 
 class SourceImage(BaseModel):
@@ -147,7 +240,15 @@ class SourceImage(BaseModel):
     max_height: Optional[int] = None
     tiles: list[Tile] = []
     working_dir: Path = Field(default_factory=tempdir_path)
+    scratch: Optional[ScratchSpace] = None
+    scratch_dirs: dict[int, Path] = {}
     version: IIIFVersions = IIIFVersions._3_0
+    output_mode: OutputModes = OutputModes.tree
+    compression: TiffCompressions = TiffCompressions.jpeg
+    checksums: bool = False
+    signatures: bool = False
+    order: ConversionOrders = ConversionOrders.standard
+    committer: OutputCommitter = Field(default_factory=OutputCommitter)
 
     # @cached_property
     @property
@@ -202,51 +303,175 @@ class SourceImage(BaseModel):
             current_scaling_factor += 1
         return scaling_widths
 
+    def level_dir(self, sf: int) -> Path:
+        """Scratch directory for the crops of one scaling factor"""
+        return self.scratch_dirs.get(sf, self.working_dir)
+
+    def prepare_scratch(self) -> None:
+        """
+        Check that there is room for every level's crops before starting, staging small levels on tmpfs and moving large ones to a fallback volume where configured.
+        """
+        self.working_dir.mkdir(parents=True, exist_ok=True)
+        self.scratch = ScratchSpace(working_dir=self.working_dir)
+        plan = self.plan()
+        self.scratch_dirs = self.scratch.allocate(
+            {level.sf: level.scratch_bytes for level in plan.levels}
+        )
+
+    @property
+    def output_directories(self) -> set[Path]:
+        """Every directory the tile plan writes to"""
+        dimensions = self.dimensions
+        directories = {
+            self.target_dir / r.path
+            for sf in self.scaling_factors
+            for r in tile_regions(
+                dimensions.width, dimensions.height, self.tile_size, sf
+            )
+        }
+        return directories | {dv.target_directory for dv in self.reduced_versions}
+
+    def prepare_output(self) -> None:
+        """Create the whole output directory skeleton up front, so tiles need no mkdir of their own"""
+        self.committer.prepare([self.target_dir, *self.output_directories])
+
+    def cleanup_scratch(self) -> None:
+        """
+        Delete the intermediate crops, any scratch directories created for them, and the working directory itself if tempdir_path created it.
+        """
+        for sf in self.scratch_dirs:
+            self.remove_level_crops(sf)
+        self.tiles = []
+        if self.scratch is not None:
+            self.scratch.cleanup()
+        self.scratch_dirs = {}
+        if self.working_dir.name.startswith(settings.SCRATCH_PREFIX):
+            try:
+                self.working_dir.rmdir()
+            except OSError:
+                pass
+
+    def crop_command(self, sf: int, img_format: IIIFFormats) -> list[str | Path]:
+        cropsize: int = self.tile_size * sf
+        return [
+            "convert",
+            self.path,
+            "-monitor",
+            "-crop",
+            f"{cropsize}x{cropsize}",
+            "-set",
+            "filename:tile",
+            "%[fx:page.x],%[fx:page.y],%[fx:w],%[fx:h]",  # rely on Imagemagick to tell us the resulting dimensions for the tiles it makes, which is especially useful on the non-square tiles from the right and bottom edges of images
+            "+repage",
+            "+adjoin",
+            self.level_dir(sf) / f"{cropsize},{sf},%[filename:tile].{img_format}",
+        ]
+
+    def collect_tiles(self, sf: int, img_format: IIIFFormats) -> None:
+        # Imagemagick will create many files from a single crop command. Collect the filenames and parse them so that we have the necessary info for the final step of the conversion.
+        generated_paths = self.level_dir(sf).glob(
+            f"{self.tile_size * sf},{sf},*.{img_format}"
+        )
+        for gp in generated_paths:
+            self.tiles.append(Tile(original_path=gp, source_image=self))
+
     def generate_tile_files(self) -> None:
-        """Write multizised tile images"""
-        for sf, img_format in track(
-            product(self.scaling_factors, self.formats),
-            description="Tiling image...",
-            total=(len(self.scaling_factors) * len(self.formats)),
-        ):
-            cropsize: int = self.tile_size * sf
-            cmd: list[str | Path] = [
-                "convert",
-                self.path,
-                "-monitor",
-                "-crop",
-                f"{cropsize}x{cropsize}",
-                "-set",
-                "filename:tile",
-                "%[fx:page.x],%[fx:page.y],%[fx:w],%[fx:h]",  # rely on Imagemagick to tell us the resulting dimensions for the tiles it makes, which is especially useful on the non-square tiles from the right and bottom edges of images
-                "+repage",
-                "+adjoin",
-                self.working_dir / f"{cropsize},{sf},%[filename:tile].{img_format}",
-            ]
-            subprocess.run(cmd, capture_output=True, check=True)
+        """Write the full-sized crops of every scaling factor, running acrop_tiles on a private event loop"""
+        for sf in self.scaling_factors:
+            run_sync(self.acrop_tiles(sf))
 
-            # Imagemagick will create many files from this single command. Collect the filenames and parse them so that we have the necessary info for the final step of the conversion.
-            generated_paths = self.working_dir.glob(f"*.{img_format}")
-            for gp in generated_paths:
-                self.tiles.append(Tile(original_path=gp, source_image=self))
+    def remove_level_crops(self, sf: int) -> None:
+        for crop in self.level_dir(sf).glob(f"{self.tile_size * sf},{sf},*"):
+            crop.unlink(missing_ok=True)
+        self.tiles = [t for t in self.tiles if t.sf != sf]
 
     def resize_tile_files(self) -> None:
-        for t in track(self.tiles, description="Sizing and sorting tiles..."):
-            t.resize()
+        """Resize the cropped tiles one scaling factor at a time, running aresize_tiles on a private event loop"""
+        for sf in sorted({t.sf for t in self.tiles}):
+            run_sync(self.aresize_tiles(sf))
+
+    @property
+    def progressive_levels(self) -> list[ConversionLevel]:
+        """
+        Reduced sizes and tile levels ordered from the lowest resolution to the highest, comparing the width of each size with the width of the full image at each tile level's scaling factor
+        """
+        width = self.dimensions.width
+        levels = [
+            (ds, ConversionLevel(kind="size", value=ds))
+            for ds in self.downsizing_levels
+        ] + [
+            (ceil(width / sf), ConversionLevel(kind="tiles", value=sf))
+            for sf in self.scaling_factors
+        ]
+        return [level for _, level in sorted(levels, key=lambda item: item[0])]
+
+    @property
+    def reduced_versions(self) -> list["DownsizedVersion"]:
+        return [
+            DownsizedVersion(downsize_width=ds, source_image=self, format=img_format)
+            for ds, img_format in product(self.downsizing_levels, self.formats)
+        ]
 
     def generate_reduced_versions(self):
         """
-        Create smaller derivatives of the full image.
+        Create smaller derivatives of the full image, running agenerate_reduced_versions on a private event loop.
         """
-        for ds, img_format in track(
-            product(self.downsizing_levels, self.formats),
-            total=(len(self.downsizing_levels) * len(self.formats)),
-            description="Reduced sizes...",
-        ):
-            for img_format in self.formats:
-                DownsizedVersion(
-                    downsize_width=ds, source_image=self, format=img_format
-                ).convert()
+        run_sync(self.agenerate_reduced_versions(self.reduced_versions))
+
+    @property
+    def pyramid_levels(self) -> list[int]:
+        """
+        Scale factors stored as resolution levels in a single-file pyramid, starting with the full-sized image
+        """
+        return [1] + self.scaling_factors
+
+    @property
+    def pyramid_file(self) -> Path:
+        return self.target_dir / f"image.{self.output_mode.value}"
+
+    def pyramid_command(self) -> list[str | Path]:
+        cmd: list[str | Path] = ["convert", self.path]
+        if self.output_mode == OutputModes.tif:
+            width = self.dimensions.width
+            # Each reduced resolution is an additional page in the TIFF, resized from the full image so that every level matches a IIIF scale factor exactly
+            for sf in self.scaling_factors:
+                cmd += ["(", "-clone", "0", "-resize", f"{ceil(width / sf)}x", ")"]
+            cmd += [
+                "-define",
+                f"tiff:tile-geometry={self.tile_size}x{self.tile_size}",
+                "-compress",
+                self.compression.value,
+            ]
+        elif self.output_mode == OutputModes.jp2:
+            # The jp2 coder reads the tile geometry from -extract when writing
+            cmd += [
+                "-define",
+                f"jp2:number-resolutions={len(self.pyramid_levels)}",
+                "-extract",
+                f"{self.tile_size}x{self.tile_size}",
+            ]
+        else:
+            raise ValueError(
+                f"{self.output_mode.value} is not a single-file output mode"
+            )
+        cmd.append(self.committer.temp_path(self.pyramid_file))
+        return cmd
+
+    def plan(self, coefficients: Optional[Coefficients] = None) -> ConversionPlan:
+        """
+        Estimate files, bytes, scratch space, memory and time for converting this image, without reading any pixels
+        """
+        dimensions = self.dimensions
+        return ConversionPlan.from_geometry(
+            width=dimensions.width,
+            height=dimensions.height,
+            tile_size=self.tile_size,
+            scaling_factors=self.scaling_factors,
+            downsizing_levels=self.downsizing_levels,
+            formats=self.formats,
+            output_mode=self.output_mode,
+            coefficients=coefficients,
+        )
 
     # @cached_property
     @property
@@ -270,27 +495,340 @@ class SourceImage(BaseModel):
 
         TODO: add ability to list arbitrary endpoint features re https://iiif.io/api/image/2.1/#profile-description
         """
-        self.manifest.write_info_file(self.target_dir)
+        self.manifest.write_info_file(self.target_dir, self.committer)
 
-    def convert(self) -> None:
+    @property
+    def cell_size(self) -> int:
+        """Side of the finest tile grid; every coarser grid is aligned to it"""
+        return self.tile_size * min(self.scaling_factors, default=1)
+
+    @property
+    def signature_file(self) -> Path:
+        return self.target_dir / settings.SIGNATURE_FILENAME
+
+    def write_signatures(self) -> None:
+        """Store per-cell pixel signatures of the source so a later update can find what changed"""
+        SignatureIndex.from_image(self.path, self.cell_size).write(
+            self.signature_file, self.committer
+        )
+
+    def dirty_tiles(self, changed: list[Rectangle]) -> dict[int, list[TileRegion]]:
+        """For each scaling factor, the tiles that overlap any of the changed rectangles"""
+        dimensions = self.dimensions
+        return {
+            sf: dirty_tiles(
+                tile_regions(dimensions.width, dimensions.height, self.tile_size, sf),
+                changed,
+            )
+            for sf in self.scaling_factors
+        }
+
+    def regenerate_tiles(self, regions: list[TileRegion]) -> list[Path]:
+        """
+        Crop and resize specific tiles straight from the source image, overwriting them in place. Each convert call reads the source once and writes a batch of tiles in every format.
+        """
+        written: list[Path] = []
+        for batch in batches(regions, settings.UPDATE_BATCH_SIZE):
+            cmd: list[str | Path] = ["convert", self.path]
+            batch_files: list[Path] = []
+            for r in batch:
+                target_dir = self.target_dir / r.path
+                self.committer.prepare([target_dir])
+                cmd += [
+                    "(",
+                    "-clone",
+                    "0",
+                    "-crop",
+                    f"{r.w}x{r.h}+{r.x}+{r.y}",
+                    "+repage",
+                    "-resize",
+                    f"{r.file_w}x{r.file_h}",
+                ]
+                for img_format in self.formats:
+                    target_file = target_dir / f"default.{img_format.value}"
+                    cmd += ["-write", self.committer.temp_path(target_file)]
+                    batch_files.append(target_file)
+                cmd += ["+delete", ")"]
+            cmd.append("null:")
+            logging.debug(f"Regenerate command: {cmd}")
+            subprocess.run(cmd, capture_output=True, check=True)
+            for target_file in batch_files:
+                self.committer.commit(target_file)
+            written += batch_files
+        self.committer.flush()
+        return written
+
+    def update(self, previous_source: Optional[Path] = None) -> UpdateReport:
+        """
+        Bring an existing tile tree up to date with a modified source image, regenerating only the tiles at each scaling factor that overlap changed pixels, plus the reduced sizes. Changes are found against `previous_source` when given, otherwise against the signatures stored by an earlier conversion. Single-file pyramids cannot be updated in place and are refused.
+        """
+        start = perf_counter()
+        try:
+            pyramid = find_pyramid(self.target_dir)
+            if self.output_mode != OutputModes.tree or pyramid is not None:
+                raise Exception(
+                    f"Only tile directory trees can be updated; re-run a full conversion to rebuild {pyramid or self.pyramid_file}"
+                )
+            if previous_source is not None:
+                previous = SignatureIndex.from_image(previous_source, self.cell_size)
+            elif self.signature_file.exists():
+                previous = SignatureIndex.parse_file(self.signature_file)
+            else:
+                raise Exception(
+                    f"No previous source given and no stored signatures found at {self.signature_file}"
+                )
+            current = SignatureIndex.from_image(self.path, self.cell_size)
+            changed = current.changed_cells(previous)
+            dirty = self.dirty_tiles(changed)
+            written: list[Path] = []
+            if changed:
+                for regions in dirty.values():
+                    written += self.regenerate_tiles(regions)
+                self.generate_reduced_versions()
+                written += [dv.target_file for dv in self.reduced_versions]
+                self.write_info()
+            current.write(self.signature_file, self.committer)
+            if (self.target_dir / settings.CHECKSUM_FILENAME).exists():
+                update_checksum_index(
+                    self.target_dir,
+                    written + [self.target_dir / "info.json", self.signature_file],
+                    committer=self.committer,
+                )
+        finally:
+            self.committer.discard()
+            self.cleanup_scratch()
+        return UpdateReport(
+            changed_cells=len(changed),
+            tiles={sf: len(regions) for sf, regions in dirty.items()},
+            elapsed=perf_counter() - start,
+        )
+
+    def convert(
+        self, on_level: Optional[Callable[[ConversionLevel], None]] = None
+    ) -> ConversionReport:
+        """
+        Convert the source image using the requested output mode, returning a report of encoding time and output size. In progressive order, `on_level` is called as info.json and each level are completed.
+
+        This runs the stages of aconvert() on a private event loop, drawing a progress bar for each stage.
+        """
+        with terminate_as_exit():
+            return run_sync(self.aconvert_tracked(on_level))
+
+    def finish_conversion(self, elapsed: float) -> ConversionReport:
+        """
+        Write the optional signature and checksum indexes, then report on the finished output. `elapsed` is the encoding time, measured before this indexing and the walk of the output tree.
+        """
+        if self.signatures:
+            self.write_signatures()
+        if self.checksums:
+            write_checksum_index(self.target_dir, committer=self.committer)
+        output_bytes, output_files = directory_size(self.target_dir)
+        return ConversionReport(
+            output_mode=self.output_mode,
+            elapsed=elapsed,
+            output_bytes=output_bytes,
+            output_files=output_files,
+        )
+
+    async def acrop_tiles(
+        self,
+        sf: int,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        events: Optional[asyncio.Queue] = None,
+    ) -> None:
+        """Crop the full image into the tiles of one scaling factor. Crops run one at a time, as each holds the full image in memory."""
+        await run_stage(
+            "tiles",
+            [self.crop_command(sf, img_format) for img_format in self.formats],
+            semaphore,
+            events,
+            concurrency=1,
+        )
+        for img_format in self.formats:
+            await run_thread(self.collect_tiles, sf, img_format)
+
+    async def aresize_tiles(
+        self,
+        sf: int,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        events: Optional[asyncio.Queue] = None,
+    ) -> None:
+        """Resize the cropped tiles of one scaling factor concurrently, then commit the level's files together"""
+        tiles = [t for t in self.tiles if t.sf == sf]
+        self.committer.prepare(t.target_dir for t in tiles)
+        await run_stage("resize", [t.resize_command for t in tiles], semaphore, events)
+        await run_thread(self.commit_files, [t.target_file for t in tiles])
+
+    async def agenerate_tiles(
+        self,
+        sf: int,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        events: Optional[asyncio.Queue] = None,
+    ) -> None:
+        """
+        Crop, then resize, the tiles of one scaling factor, removing its crops once the level is written.
+        """
+        await self.acrop_tiles(sf, semaphore, events)
+        await self.aresize_tiles(sf, semaphore, events)
+        await run_thread(self.remove_level_crops, sf)
+
+    async def agenerate_reduced_versions(
+        self,
+        reduced_versions: list["DownsizedVersion"],
+        semaphore: Optional[asyncio.Semaphore] = None,
+        events: Optional[asyncio.Queue] = None,
+    ) -> None:
+        """Create smaller derivatives of the full image one at a time, as each holds the full image in memory"""
+        self.committer.prepare(dv.target_directory for dv in reduced_versions)
+        await run_stage(
+            "sizes",
+            [dv.command for dv in reduced_versions],
+            semaphore,
+            events,
+            concurrency=1,
+        )
+        await run_thread(self.commit_files, [dv.target_file for dv in reduced_versions])
+
+    def commit_files(self, files: list[Path]) -> None:
+        """Commit a finished batch of output files, then flush any the fsync policy held back"""
+        for f in files:
+            self.committer.commit(f)
+        self.committer.flush()
+
+    async def agenerate_pyramid(
+        self,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        events: Optional[asyncio.Queue] = None,
+    ) -> None:
+        """
+        Write a single tiled, multi-resolution file in place of the tile directory tree, using the same tile size and scale factors.
+        """
+        self.committer.prepare([self.target_dir])
+        cmd = await run_thread(self.pyramid_command)
+        logging.debug(f"Pyramid command: {cmd}")
+        await run_stage("pyramid", [cmd], semaphore, events)
+        await run_thread(self.commit_files, [self.pyramid_file])
+
+    async def aconvert_tree(
+        self,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        events: Optional[asyncio.Queue] = None,
+    ) -> None:
         """
         Four-stage generation:
 
         1. Use convert's -crop function to write tilesets at each of the scaling factors appropriate for the image (e.g. tiles at 256, 512, 1024 px on a side, etc.) Stores intermediate files to a temporary directory
+        2. Use convert's -resize function to reduce the cropped tiles to the specified tile size. These resized tiles are saved to the specified output directory with the right nested directory structure expected of IIIF tiles.
+
+        Steps 1 and 2 run one scaling factor at a time.
+
+        3. Generate downsized whole-image versions.
+        4. Write the IIIF image information JSON file
         """
-        self.generate_tile_files()
+        scaling_factors = await run_thread(lambda: self.scaling_factors)
+        for sf in scaling_factors:
+            await self.agenerate_tiles(sf, semaphore, events)
+        reduced_versions = await run_thread(lambda: self.reduced_versions)
+        await self.agenerate_reduced_versions(reduced_versions, semaphore, events)
+        await run_thread(self.write_info)
+
+    async def aconvert_progressive(
+        self,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        events: Optional[asyncio.Queue] = None,
+        on_level: Optional[Callable[[ConversionLevel], None]] = None,
+    ) -> None:
         """
-        2. Use convert's -resize function to reduce the cropped tiles to the specified tile size. These resized tiles are saved to the specified output directory with the right nested directory structure expected of IIIF tiles.
+        Publish info.json first, then write levels from the lowest resolution to the highest, so that a viewer can open the image while the finest tiles are still being made.
         """
-        self.resize_tile_files()
+        start = perf_counter()
+        await run_thread(self.write_info)
+        report_level(ConversionLevel(kind="info"), start, on_level)
+        levels = await run_thread(lambda: self.progressive_levels)
+        for level in levels:
+            if level.kind == "size":
+                await self.agenerate_reduced_versions(
+                    [
+                        DownsizedVersion(
+                            downsize_width=level.value,
+                            source_image=self,
+                            format=img_format,
+                        )
+                        for img_format in self.formats
+                    ],
+                    semaphore,
+                    events,
+                )
+            else:
+                await self.agenerate_tiles(level.value, semaphore, events)
+            report_level(level, start, on_level)
+
+    async def aconvert(
+        self,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        events: Optional[asyncio.Queue] = None,
+        on_level: Optional[Callable[[ConversionLevel], None]] = None,
+    ) -> ConversionReport:
         """
-        3. Generate downsized whole-image versions.
+        Convert the source image without blocking an event loop. This is the one stage sequence behind convert().
+
+        ImageMagick runs in child processes started with asyncio.create_subprocess_exec. Tile resizes run concurrently, holding `semaphore` while they run (by default a new one allowing settings.ASYNC_CONCURRENCY processes); share one semaphore between conversions to bound a whole service. Crop and reduced-size commands each hold the full image in memory, so within a conversion they run one at a time, matching the peak memory estimated by plan(). Cancelling the task kills running child processes and removes scratch and temporary output files. A ProgressEvent is put on `events` as each command finishes, and in progressive order `on_level` is called as each level completes.
         """
-        self.generate_reduced_versions()
+        semaphore = semaphore or asyncio.Semaphore(settings.ASYNC_CONCURRENCY)
+        start = perf_counter()
+        try:
+            if self.output_mode != OutputModes.tree:
+                await self.agenerate_pyramid(semaphore, events)
+                await run_thread(self.write_info)
+            else:
+                await run_thread(self.prepare_scratch)
+                await run_thread(self.prepare_output)
+                if self.order == ConversionOrders.progressive:
+                    await self.aconvert_progressive(semaphore, events, on_level)
+                else:
+                    await self.aconvert_tree(semaphore, events)
+        finally:
+            self.committer.discard()
+            self.cleanup_scratch()
+        return await run_thread(self.finish_conversion, perf_counter() - start)
+
+    async def aconvert_tracked(
+        self, on_level: Optional[Callable[[ConversionLevel], None]] = None
+    ) -> ConversionReport:
+        """Run aconvert(), drawing a progress bar for each stage as its events arrive"""
+        events: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self.aconvert(events=events, on_level=on_level))
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        bars: dict[str, TaskID] = {}
+        with Progress() as progress:
+            while (event := await events.get()) is not None:
+                if event.stage not in bars:
+                    bars[event.stage] = progress.add_task(
+                        event.stage, total=event.total
+                    )
+                progress.update(
+                    bars[event.stage], completed=event.completed, total=event.total
+                )
+        return await task
+
+    async def aconvert_progress(
+        self, semaphore: Optional[asyncio.Semaphore] = None
+    ) -> AsyncIterator[ProgressEvent]:
         """
-        4. Write the IIIF image information JSON file
+        Run aconvert() in a task and yield its progress events as they happen. A failed conversion raises from the iterator; closing the iterator early cancels the conversion.
         """
-        self.write_info()
+        events: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self.aconvert(semaphore, events))
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+            await task
+        finally:
+            if not task.done():
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
 
 
 Tile.update_forward_refs()
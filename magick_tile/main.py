@@ -1,7 +1,18 @@
+import logging
 import typer
 from pathlib import Path
+from typing import Optional
 
-from magick_tile import generator, settings
+from magick_tile import (
+    committer,
+    generator,
+    manifest,
+    planner,
+    scratch,
+    settings,
+    verifier,
+    watcher,
+)
 
 app = typer.Typer()
 
@@ -37,12 +48,223 @@ def convert(
     version: settings.IIIFVersions = typer.Option(
         default="3.0", help="IIIF Image API version"
     ),
+    output_mode: settings.OutputModes = typer.Option(
+        default="tree",
+        help="Write a IIIF Level 0 directory tree, or a single tiled pyramidal TIFF or JP2 file",
+    ),
+    compression: settings.TiffCompressions = typer.Option(
+        default="jpeg", help="Tile compression for pyramidal TIFF output"
+    ),
+    dry_run: bool = typer.Option(
+        default=False,
+        help="Print a JSON plan of the files, bytes, scratch space, memory and time the conversion needs, without converting",
+    ),
+    calibrate: Optional[Path] = typer.Option(
+        default=None,
+        exists=True,
+        dir_okay=False,
+        help="Sample image used to calibrate the per-format size and speed estimates of --dry-run",
+    ),
+    checksums: bool = typer.Option(
+        default=False,
+        help="Write a checksum index of every output file for later use by 'verify --checksums'",
+    ),
+    signatures: bool = typer.Option(
+        default=False,
+        help="Store pixel signatures of the source so that 'update' can later find changed regions without the original file",
+    ),
+    scratch_dir: Optional[Path] = typer.Option(
+        default=None,
+        exists=True,
+        file_okay=False,
+        help="Directory for intermediate crops [default: $SCRATCH_DIR or the system temp directory]",
+    ),
+    order: settings.ConversionOrders = typer.Option(
+        default="standard",
+        help="'progressive' writes info.json first, then each size and tile level from the lowest resolution to the highest",
+    ),
+    fsync: settings.FsyncPolicies = typer.Option(
+        default=settings.settings.FSYNC_POLICY.value,
+        help="Durability of output files: 'none' leaves flushing to the OS, 'level' fsyncs each finished level in one batch, 'file' fsyncs every file as it is written",
+    ),
 ):
     """
     Efficiently create derivative tiles of a very large image, and structure them into directories compliant with IIIF Level 0.
     """
 
     si = generator.SourceImage(
-        id=identifier, path=source, tile_size=tile_size, target_dir=output, formats=format, version=version  # type: ignore
+        id=identifier, path=source, tile_size=tile_size, target_dir=output, formats=format, version=version, output_mode=output_mode, compression=compression, checksums=checksums, signatures=signatures, working_dir=scratch.scratch_dir(scratch_dir), order=order, committer=committer.OutputCommitter(fsync=fsync)  # type: ignore
+    )
+    if dry_run:
+        coefficients = planner.calibrate(calibrate, format) if calibrate else None
+        typer.echo(si.plan(coefficients).json(indent=2))
+        si.cleanup_scratch()
+        return
+    report = si.convert(on_level=typer.echo)
+    typer.echo(report)
+
+
+@app.command()
+def update(
+    source: Path = typer.Argument(
+        ...,
+        show_default=False,
+        file_okay=True,
+        dir_okay=False,
+        readable=True,
+        exists=True,
+        help="Modified source image",
+    ),
+    output: Path = typer.Argument(
+        ...,
+        show_default=False,
+        file_okay=False,
+        dir_okay=True,
+        exists=True,
+        help="Existing tile directory containing an info.json",
+    ),
+    old_source: Optional[Path] = typer.Option(
+        default=None,
+        exists=True,
+        dir_okay=False,
+        help="Previous version of the source image [default: use the signatures stored by 'convert --signatures']",
+    ),
+):
+    """
+    Regenerate only the tiles and reduced sizes affected by changes to the source image. The identifier, tile size and formats are read from the existing info.json.
+    """
+    existing = manifest.IIIFManifest.parse_file(output / "info.json")
+    si = generator.SourceImage(
+        id=existing.id,
+        path=source,
+        tile_size=existing.tiles[0].width if existing.tiles else 512,
+        target_dir=output,
+        formats=existing.preferredFormats or [settings.IIIFFormats.jpg],
+    )
+    report = si.update(previous_source=old_source)
+    typer.echo(report)
+
+
+@app.command()
+def watch(
+    input_dir: Path = typer.Argument(
+        ...,
+        show_default=False,
+        file_okay=False,
+        dir_okay=True,
+        exists=True,
+        help="Drop directory to watch for new images",
+    ),
+    output: Path = typer.Argument(
+        ...,
+        show_default=False,
+        file_okay=False,
+        dir_okay=True,
+        writable=True,
+        help="Destination directory; each image is tiled into a subdirectory named after its file stem",
+    ),
+    base_id: str = typer.Argument(
+        ...,
+        show_default=False,
+        help="Base identifier; each image's info.json id is this URL followed by its file stem (e.g. https://example.com/iiif)",
+    ),
+    done_dir: Optional[Path] = typer.Option(
+        default=None,
+        file_okay=False,
+        help="Where finished sources are moved [default: INPUT_DIR/done]",
+    ),
+    error_dir: Optional[Path] = typer.Option(
+        default=None,
+        file_okay=False,
+        help="Where failed sources are moved [default: INPUT_DIR/error]",
+    ),
+    workers: int = typer.Option(default=2, help="Number of concurrent conversions"),
+    interval: float = typer.Option(
+        default=2.0, help="Seconds between scans of the input directory"
+    ),
+    settle: float = typer.Option(
+        default=5.0,
+        help="Seconds a file must go unmodified before it is considered completely written",
+    ),
+    queue_file: Optional[Path] = typer.Option(
+        default=None,
+        dir_okay=False,
+        help="Text file of additional source paths, one per line, read as it grows",
+    ),
+    stats_file: Optional[Path] = typer.Option(
+        default=None,
+        dir_okay=False,
+        help="JSON file updated with queue depth and throughput counters",
+    ),
+    once: bool = typer.Option(
+        default=False, help="Exit once every waiting image has been processed"
+    ),
+    tile_size: int = typer.Option(default=512, help="Tile size to produce"),
+    format: list[settings.IIIFFormats] = typer.Option(
+        default=["jpg"],
+        help="File formats to generate (must be supported by Imagemagick's 'convert')",
+    ),
+):
+    """
+    Watch a drop directory and convert new images with a fixed pool of warm worker processes.
+    """
+    logging.basicConfig(level=logging.INFO)
+    folder = watcher.DropFolder(
+        input_dir=input_dir,
+        output_dir=output,
+        base_id=base_id,
+        done_dir=done_dir or input_dir / "done",
+        error_dir=error_dir or input_dir / "error",
+        tile_size=tile_size,
+        formats=format,
+        workers=workers,
+        interval=interval,
+        settle=settle,
+        queue_file=queue_file,
+        stats_file=stats_file,
+    )
+    stats = folder.run(once=once)
+    typer.echo(stats)
+
+
+@app.command()
+def verify(
+    output: Path = typer.Argument(
+        ...,
+        show_default=False,
+        file_okay=False,
+        dir_okay=True,
+        exists=True,
+        help="Tile directory containing an info.json",
+    ),
+    source: Optional[Path] = typer.Option(
+        default=None,
+        exists=True,
+        dir_okay=False,
+        help="Source image whose dimensions should match info.json",
+    ),
+    dimensions: bool = typer.Option(
+        default=True, help="Check image dimensions by reading file headers"
+    ),
+    checksums: bool = typer.Option(
+        default=False,
+        help="Check files against the checksum index written by 'convert --checksums'",
+    ),
+    workers: int = typer.Option(
+        default=settings.settings.VERIFY_WORKERS,
+        help="Number of parallel directory scans and header reads",
+    ),
+):
+    """
+    Check that a tile directory is complete: every tile and size listed by its info.json exists, is non-empty, and has the expected dimensions.
+    """
+    report = verifier.verify(
+        output,
+        source=source,
+        check_dimensions=dimensions,
+        check_checksums=checksums,
+        workers=workers,
     )
-    si.convert()
+    typer.echo(report)
+    if not report.ok:
+        raise typer.Exit(code=1)
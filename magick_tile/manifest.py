@@ -3,6 +3,7 @@ from pathlib import Path
 
 from pydantic import BaseModel, Field, HttpUrl
 
+from magick_tile.committer import OutputCommitter
 from magick_tile.settings import IIIFFormats
 
 
@@ -34,7 +35,11 @@ class IIIFManifest(BaseModel):
     maxArea: Optional[int] = None
     rights: Optional[str] = None
 
-    def write_info_file(self, output_dir: Path) -> None:
-        """Write json serialization to info.json at the specified output directory."""
-        output_file = output_dir / "info.json"
-        output_file.write_text(self.json(by_alias=True, exclude_none=True, indent=2))
+    def write_info_file(
+        self, output_dir: Path, committer: Optional[OutputCommitter] = None
+    ) -> None:
+        """Write json serialization to info.json at the specified output directory, replacing any existing file atomically."""
+        (committer or OutputCommitter()).write_text(
+            output_dir / "info.json",
+            self.json(by_alias=True, exclude_none=True, indent=2),
+        )
@@ -0,0 +1,233 @@
+"""
+Estimate the work a conversion will do from the image geometry alone, without reading any pixels.
+"""
+
+import subprocess
+from math import ceil, floor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Optional
+
+from pydantic import BaseModel
+
+from magick_tile.settings import settings, IIIFFormats, OutputModes
+
+
+class TileRegion(BaseModel):
+    """A single tile of the IIIF grid: a region of the full image at a given scaling factor"""
+
+    sf: int
+    x: int
+    y: int
+    w: int
+    h: int
+    tile_size: int
+
+    @property
+    def file_w(self) -> int:
+        return (
+            ceil(self.w / self.sf)
+            if self.w < self.tile_size * self.sf
+            else self.tile_size
+        )
+
+    @property
+    def file_h(self) -> int:
+        return (
+            floor(self.h / self.sf)
+            if self.h < self.tile_size * self.sf
+            else self.tile_size
+        )
+
+    @property
+    def path(self) -> Path:
+        """Directory holding this tile, relative to the output directory"""
+        return Path(f"{self.x},{self.y},{self.w},{self.h}") / f"{self.file_w}," / "0"
+
+
+def tile_regions(width: int, height: int, tile_size: int, sf: int) -> list[TileRegion]:
+    """
+    List the tiles that convert's -crop will produce at a given scaling factor, in the same left-to-right, top-to-bottom order.
+    """
+    cropsize = tile_size * sf
+    return [
+        TileRegion(
+            sf=sf,
+            x=x,
+            y=y,
+            w=min(cropsize, width - x),
+            h=min(cropsize, height - y),
+            tile_size=tile_size,
+        )
+        for y in range(0, height, cropsize)
+        for x in range(0, width, cropsize)
+    ]
+
+
+def batches(items: list, size: int) -> list[list]:
+    """Split a list into consecutive chunks of at most `size` items"""
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def downsized_height(width: int, height: int, downsize_width: int) -> int:
+    """Height of a reduced version of the full image, as produced by convert's -geometry"""
+    return max(1, round(height * downsize_width / width))
+
+
+class Coefficients(BaseModel):
+    """Per-format costs used to turn pixel counts into bytes and seconds"""
+
+    bytes_per_pixel: dict[IIIFFormats, float] = settings.BYTES_PER_PIXEL
+    pixels_per_second: dict[IIIFFormats, float] = settings.PIXELS_PER_SECOND
+
+
+def calibrate(sample: Path, formats: list[IIIFFormats]) -> Coefficients:
+    """
+    Measure encoded size and throughput for each format by converting a short sample image, starting from the default coefficients.
+    """
+    coefficients = Coefficients()
+    with TemporaryDirectory() as tmpdir:
+        for img_format in formats:
+            output_file = Path(tmpdir) / f"sample.{img_format.value}"
+            start = perf_counter()
+            subprocess.run(
+                ["convert", sample, output_file], capture_output=True, check=True
+            )
+            elapsed = perf_counter() - start
+            identify_stdout = subprocess.run(
+                ["identify", "-ping", "-format", "%w %h\n", output_file],
+                capture_output=True,
+                check=True,
+            ).stdout.decode("utf-8")
+            w, h = identify_stdout.splitlines()[0].split()
+            pixels = int(w) * int(h)
+            coefficients.bytes_per_pixel[img_format] = (
+                output_file.stat().st_size / pixels
+            )
+            coefficients.pixels_per_second[img_format] = pixels / elapsed
+    return coefficients
+
+
+class LevelPlan(BaseModel):
+    sf: int
+    tiles: int
+    output_pixels: int
+    scratch_bytes: int
+
+
+class ConversionPlan(BaseModel):
+    output_mode: OutputModes
+    width: int
+    height: int
+    tile_size: int
+    formats: list[IIIFFormats]
+    scaling_factors: list[int]
+    downsizing_levels: list[int]
+    levels: list[LevelPlan]
+    tile_files: int
+    size_files: int
+    total_files: int
+    directories: int
+    output_bytes: int
+    scratch_bytes: int
+    peak_memory_bytes: int
+    estimated_seconds: float
+
+    @classmethod
+    def from_geometry(
+        cls,
+        width: int,
+        height: int,
+        tile_size: int,
+        scaling_factors: list[int],
+        downsizing_levels: list[int],
+        formats: list[IIIFFormats],
+        output_mode: OutputModes = OutputModes.tree,
+        coefficients: Optional[Coefficients] = None,
+    ) -> "ConversionPlan":
+        """
+        Compute the full work plan for a conversion.
+
+        Scratch space covers the full-sized crops written for every scaling factor and format before they are resized. Peak memory is ImageMagick's pixel cache for the full image. Time is estimated from the number of pixels each convert call reads.
+        """
+        coefficients = coefficients or Coefficients()
+        bpp = coefficients.bytes_per_pixel
+        pps = coefficients.pixels_per_second
+        full_pixels = width * height
+        cache_bytes = full_pixels * settings.MAGICK_BYTES_PER_PIXEL
+
+        if output_mode != OutputModes.tree:
+            pyramid_format = IIIFFormats[output_mode.value]
+            pyramid_pixels = sum(
+                ceil(width / sf) * ceil(height / sf) for sf in [1] + scaling_factors
+            )
+            return cls(
+                output_mode=output_mode,
+                width=width,
+                height=height,
+                tile_size=tile_size,
+                formats=formats,
+                scaling_factors=scaling_factors,
+                downsizing_levels=downsizing_levels,
+                levels=[],
+                tile_files=1,
+                size_files=0,
+                total_files=2,
+                directories=1,
+                output_bytes=round(pyramid_pixels * bpp[pyramid_format]),
+                scratch_bytes=0,
+                peak_memory_bytes=pyramid_pixels * settings.MAGICK_BYTES_PER_PIXEL,
+                estimated_seconds=pyramid_pixels / pps[pyramid_format],
+            )
+
+        levels: list[LevelPlan] = []
+        directories: set[Path] = set()
+        for sf in scaling_factors:
+            regions = tile_regions(width, height, tile_size, sf)
+            for r in regions:
+                directories.update(r.path.parents)
+                directories.add(r.path)
+            levels.append(
+                LevelPlan(
+                    sf=sf,
+                    tiles=len(regions),
+                    output_pixels=sum(r.file_w * r.file_h for r in regions),
+                    scratch_bytes=round(sum(full_pixels * bpp[f] for f in formats)),
+                )
+            )
+        for ds in downsizing_levels:
+            directories.update(
+                [Path("full"), Path("full") / f"{ds},", Path("full") / f"{ds}," / "0"]
+            )
+        directories.discard(Path("."))
+
+        size_pixels = sum(
+            ds * downsized_height(width, height, ds) for ds in downsizing_levels
+        )
+        tile_pixels = sum(level.output_pixels for level in levels)
+        # Each scaling factor reads the full image once to crop and once more across all of its resizes; each reduced size reads the full image
+        work_pixels = full_pixels * (2 * len(scaling_factors) + len(downsizing_levels))
+        return cls(
+            output_mode=output_mode,
+            width=width,
+            height=height,
+            tile_size=tile_size,
+            formats=formats,
+            scaling_factors=scaling_factors,
+            downsizing_levels=downsizing_levels,
+            levels=levels,
+            tile_files=sum(level.tiles for level in levels) * len(formats),
+            size_files=len(downsizing_levels) * len(formats),
+            total_files=(sum(level.tiles for level in levels) + len(downsizing_levels))
+            * len(formats)
+            + 1,
+            directories=len(directories),
+            output_bytes=round(
+                sum((tile_pixels + size_pixels) * bpp[f] for f in formats)
+            ),
+            # A level's crops are removed before the next level is cropped, so only one level is ever on disk
+            scratch_bytes=max((level.scratch_bytes for level in levels), default=0),
+            peak_memory_bytes=cache_bytes,
+            estimated_seconds=sum(work_pixels / pps[f] for f in formats),
+        )
@@ -0,0 +1,111 @@
+"""
+Decide where the intermediate crops of a conversion are written, and make sure they are removed afterwards.
+"""
+
+import shutil
+import signal
+import threading
+from contextlib import contextmanager
+from math import ceil
+from pathlib import Path
+from tempfile import mkdtemp
+from typing import Iterator, Optional
+
+from pydantic import BaseModel
+
+from magick_tile.settings import settings
+
+
+class InsufficientScratchSpace(Exception):
+    pass
+
+
+def free_space(path: Path) -> int:
+    return shutil.disk_usage(path).free
+
+
+def scratch_dir(parent: Optional[Path] = None) -> Path:
+    """Create a uniquely named scratch directory, by default in settings.SCRATCH_DIR or the system temp directory"""
+    return Path(
+        mkdtemp(prefix=settings.SCRATCH_PREFIX, dir=parent or settings.SCRATCH_DIR)
+    )
+
+
+@contextmanager
+def terminate_as_exit() -> Iterator[None]:
+    """
+    Treat SIGTERM as SystemExit while the context is active, so that cleanup in finally blocks still runs and subprocess.run kills its child. Signal handlers can only be installed from the main thread; elsewhere this does nothing.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def handler(signum, frame):
+        raise SystemExit(128 + signum)
+
+    previous = signal.signal(signal.SIGTERM, handler)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+
+class ScratchSpace(BaseModel):
+    working_dir: Path
+    tmpfs_dir: Optional[Path] = settings.SCRATCH_TMPFS_DIR
+    fallback_dirs: list[Path] = settings.SCRATCH_FALLBACK_DIRS
+    created: list[Path] = []
+
+    def make_dir(self, parent: Path) -> Path:
+        d = scratch_dir(parent)
+        self.created.append(d)
+        return d
+
+    def allocate(self, level_bytes: dict[int, int]) -> dict[int, Path]:
+        """
+        Assign a scratch directory to each scaling factor, given an estimate of the bytes its crops need.
+
+        Levels are cropped one at a time and their crops are removed before the next level starts, so each level is checked on its own. A level is staged on tmpfs if it fits within settings.SCRATCH_TMPFS_FRACTION of its free space. The other levels go to the working directory, or to the first fallback directory with enough free space for the largest of them. Raises InsufficientScratchSpace before any work starts if no candidate is large enough.
+        """
+        needed = {
+            sf: ceil(b * settings.SCRATCH_HEADROOM) for sf, b in level_bytes.items()
+        }
+        level_dirs: dict[int, Path] = {}
+        tmpfs_budget = (
+            free_space(self.tmpfs_dir) * settings.SCRATCH_TMPFS_FRACTION
+            if self.tmpfs_dir is not None
+            else 0
+        )
+        disk_levels: list[int] = []
+        tmpfs_level_dir: Optional[Path] = None
+        for sf, b in needed.items():
+            if self.tmpfs_dir is not None and b <= tmpfs_budget:
+                tmpfs_level_dir = tmpfs_level_dir or self.make_dir(self.tmpfs_dir)
+                level_dirs[sf] = tmpfs_level_dir
+            else:
+                disk_levels.append(sf)
+        if not disk_levels:
+            return level_dirs
+
+        disk_bytes = max(needed[sf] for sf in disk_levels)
+        for candidate in [self.working_dir, *self.fallback_dirs]:
+            if free_space(candidate) >= disk_bytes:
+                disk_dir = (
+                    candidate
+                    if candidate == self.working_dir
+                    else self.make_dir(candidate)
+                )
+                break
+        else:
+            raise InsufficientScratchSpace(
+                f"{disk_bytes} bytes of scratch space are needed, but neither {self.working_dir} nor any fallback directory ({', '.join(str(d) for d in self.fallback_dirs) or 'none configured'}) has that much free"
+            )
+        for sf in disk_levels:
+            level_dirs[sf] = disk_dir
+        return level_dirs
+
+    def cleanup(self) -> None:
+        """Remove every directory this scratch space created"""
+        for d in self.created:
+            shutil.rmtree(d, ignore_errors=True)
+        self.created = []
@@ -1,4 +1,6 @@
 from enum import Enum
+from pathlib import Path
+from typing import Optional
 
 from pydantic import BaseSettings
 
@@ -18,6 +20,28 @@ class IIIFVersions(str, Enum):
     # _2_1 = "2.1" Not yet implemented
 
 
+class OutputModes(str, Enum):
+    tree = "tree"
+    tif = "tif"
+    jp2 = "jp2"
+
+
+class TiffCompressions(str, Enum):
+    jpeg = "jpeg"
+    deflate = "deflate"
+
+
+class FsyncPolicies(str, Enum):
+    none = "none"
+    level = "level"
+    file = "file"
+
+
+class ConversionOrders(str, Enum):
+    standard = "standard"
+    progressive = "progressive"
+
+
 class IIIFFullSize(str, Enum):
     _2 = "max"
     _3 = "max"
@@ -25,6 +49,64 @@ class IIIFFullSize(str, Enum):
 
 class Settings(BaseSettings):
     MINIMUMUM_DOWNSIZE_EXP: int = 8
+    # Default cost coefficients for conversion plans. Run a calibration against a representative sample to replace them.
+    BYTES_PER_PIXEL: dict[IIIFFormats, float] = {
+        IIIFFormats.jpg: 0.3,
+        IIIFFormats.tif: 3.0,
+        IIIFFormats.png: 2.0,
+        IIIFFormats.gif: 0.8,
+        IIIFFormats.jp2: 1.5,
+        IIIFFormats.pdf: 3.0,
+        IIIFFormats.webp: 0.2,
+    }
+    PIXELS_PER_SECOND: dict[IIIFFormats, float] = {
+        IIIFFormats.jpg: 3.0e7,
+        IIIFFormats.tif: 4.0e7,
+        IIIFFormats.png: 8.0e6,
+        IIIFFormats.gif: 1.0e7,
+        IIIFFormats.jp2: 3.0e6,
+        IIIFFormats.pdf: 1.0e7,
+        IIIFFormats.webp: 5.0e6,
+    }
+    # Size of one pixel in ImageMagick's pixel cache (4 channels at 16 bits for a Q16 build)
+    MAGICK_BYTES_PER_PIXEL: int = 8
+    CHECKSUM_FILENAME: str = "checksums.sha256"
+    VERIFY_WORKERS: int = 16
+    # Number of files whose headers are read by a single identify call
+    VERIFY_BATCH_SIZE: int = 256
+    SIGNATURE_FILENAME: str = "signatures.json"
+    # Number of changed tiles cropped and resized from a single read of the source image during an update
+    UPDATE_BATCH_SIZE: int = 64
+    # Scratch space for intermediate crops. SCRATCH_DIR defaults to the system temp directory; if the largest level does not fit there, crops spill to the first SCRATCH_FALLBACK_DIRS entry with room. Set SCRATCH_TMPFS_DIR (e.g. /dev/shm) to stage each level that fits in memory.
+    SCRATCH_DIR: Optional[Path] = None
+    SCRATCH_FALLBACK_DIRS: list[Path] = []
+    SCRATCH_TMPFS_DIR: Optional[Path] = None
+    SCRATCH_TMPFS_FRACTION: float = 0.5
+    # Multiplier applied to the planner's scratch estimate before checking free space
+    SCRATCH_HEADROOM: float = 1.2
+    SCRATCH_PREFIX: str = "magick_tile_"
+    # Default number of ImageMagick processes a single asynchronous conversion runs at once
+    ASYNC_CONCURRENCY: int = 4
+    # Extensions of source images picked up from a watched drop directory, compared case-insensitively
+    WATCH_EXTENSIONS: set[str] = {
+        "jpg",
+        "jpeg",
+        "tif",
+        "tiff",
+        "png",
+        "gif",
+        "webp",
+        "jp2",
+        "j2k",
+        "jpx",
+        "bmp",
+        "psd",
+        "psb",
+        "dng",
+        "heic",
+    }
+    # Durability of output files: "none", batched per-"level" or per-"file" fsync
+    FSYNC_POLICY: FsyncPolicies = FsyncPolicies.none
 
 
 settings = Settings()
@@ -0,0 +1,88 @@
+"""
+Track which regions of a source image changed between two versions, so that only the tiles covering them need to be regenerated.
+"""
+
+import subprocess
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel
+
+from magick_tile.committer import OutputCommitter
+from magick_tile.planner import TileRegion
+
+
+class Rectangle(BaseModel):
+    x: int
+    y: int
+    w: int
+    h: int
+
+    def intersects(self, region: TileRegion) -> bool:
+        return (
+            self.x < region.x + region.w
+            and region.x < self.x + self.w
+            and self.y < region.y + region.h
+            and region.y < self.y + self.h
+        )
+
+
+class SignatureIndex(BaseModel):
+    """Pixel signatures of every cell of a grid laid over the source image"""
+
+    width: int
+    height: int
+    cell_size: int
+    signatures: dict[str, str]
+
+    @classmethod
+    def from_image(cls, path: Path, cell_size: int) -> "SignatureIndex":
+        """
+        Crop the image into cells and have ImageMagick report the SHA-256 signature of each cell's pixels, without writing any files.
+        """
+        cmd: list[str | Path] = [
+            "convert",
+            path,
+            "-crop",
+            f"{cell_size}x{cell_size}",
+            "-format",
+            "%[fx:page.x],%[fx:page.y],%[fx:w],%[fx:h] %# %W %H\n",
+            "info:",
+        ]
+        info_stdout = subprocess.run(
+            cmd, capture_output=True, check=True
+        ).stdout.decode("utf-8")
+        signatures: dict[str, str] = {}
+        width = height = 0
+        for line in info_stdout.splitlines():
+            cell, signature, width_str, height_str = line.split(" ")
+            signatures[cell] = signature
+            width, height = int(width_str), int(height_str)
+        return cls(
+            width=width, height=height, cell_size=cell_size, signatures=signatures
+        )
+
+    def write(self, path: Path, committer: Optional[OutputCommitter] = None) -> None:
+        (committer or OutputCommitter()).write_text(path, self.json())
+
+    def changed_cells(self, previous: "SignatureIndex") -> list[Rectangle]:
+        """List the cells whose pixels differ from a previous index of the same image geometry"""
+        if (self.width, self.height, self.cell_size) != (
+            previous.width,
+            previous.height,
+            previous.cell_size,
+        ):
+            raise Exception(
+                f"Cannot compare a {self.width}x{self.height} image on a {self.cell_size}px grid with a {previous.width}x{previous.height} image on a {previous.cell_size}px grid; re-run a full conversion instead"
+            )
+        changed: list[Rectangle] = []
+        for cell, signature in self.signatures.items():
+            if previous.signatures.get(cell) != signature:
+                x, y, w, h = (int(i) for i in cell.split(","))
+                changed.append(Rectangle(x=x, y=y, w=w, h=h))
+        return changed
+
+
+def dirty_tiles(regions: list[TileRegion], dirty: list[Rectangle]) -> list[TileRegion]:
+    """Select the tiles of one scaling factor that overlap any changed rectangle"""
+    return [r for r in regions if any(d.intersects(r) for d in dirty)]
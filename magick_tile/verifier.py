@@ -0,0 +1,405 @@
+"""
+Check a tile directory tree against the tiles and sizes its info.json promises, without decoding any images.
+"""
+
+import hashlib
+import os
+import struct
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel
+
+from magick_tile.committer import OutputCommitter
+from magick_tile.manifest import IIIFManifest
+from magick_tile.planner import batches, downsized_height, tile_regions
+from magick_tile.settings import settings, OutputModes
+
+
+class ExpectedFile(BaseModel):
+    path: Path
+    width: int
+    height: int
+
+
+def expected_files(manifest: IIIFManifest) -> list[ExpectedFile]:
+    """Derive every tile and reduced size path, relative to the output directory, that a manifest describes"""
+    formats = manifest.preferredFormats or []
+    expected: list[ExpectedFile] = []
+    for tile_scale in manifest.tiles or []:
+        for sf in tile_scale.scaleFactors:
+            for region in tile_regions(
+                manifest.width, manifest.height, tile_scale.width, sf
+            ):
+                for img_format in formats:
+                    expected.append(
+                        ExpectedFile(
+                            path=region.path / f"default.{img_format.value}",
+                            width=region.file_w,
+                            height=region.file_h,
+                        )
+                    )
+    for size in manifest.sizes or []:
+        if not isinstance(size.width, int):
+            continue
+        for img_format in formats:
+            expected.append(
+                ExpectedFile(
+                    path=Path("full")
+                    / f"{size.width},"
+                    / "0"
+                    / f"default.{img_format.value}",
+                    width=size.width,
+                    height=downsized_height(
+                        manifest.width, manifest.height, size.width
+                    ),
+                )
+            )
+    return expected
+
+
+def find_pyramid(output_dir: Path) -> Optional[Path]:
+    """Return the single-file pyramid in an output directory made with a tif or jp2 output mode, if there is one"""
+    for mode in OutputModes:
+        candidate = output_dir / f"image.{mode.value}"
+        if mode != OutputModes.tree and candidate.is_file():
+            return candidate
+    return None
+
+
+class PyramidLevel(BaseModel):
+    width: int
+    height: int
+    tile_width: Optional[int] = None
+    tile_height: Optional[int] = None
+
+
+# TIFF field types that hold the integer tags read here, and their struct formats
+TIFF_INTEGER_TYPES = {3: "H", 4: "I", 16: "Q"}
+
+
+def tiff_levels(path: Path) -> list[PyramidLevel]:
+    """
+    Read the size and tile geometry of every page of a classic or BigTIFF file by walking its IFD chain, without reading any pixel data.
+    """
+    levels: list[PyramidLevel] = []
+    with open(path, "rb") as f:
+        header = f.read(16)
+        order = {b"II": "<", b"MM": ">"}[header[:2]]
+        (version,) = struct.unpack(order + "H", header[2:4])
+        if version == 43:
+            count_format, entry_format, offset_format = "Q", "HHQ8s", "Q"
+            (offset,) = struct.unpack(order + "Q", header[8:16])
+        else:
+            count_format, entry_format, offset_format = "H", "HHI4s", "I"
+            (offset,) = struct.unpack(order + "I", header[4:8])
+        seen: set[int] = set()
+        while offset and offset not in seen:
+            seen.add(offset)
+            f.seek(offset)
+            (count,) = struct.unpack(
+                order + count_format, f.read(struct.calcsize(order + count_format))
+            )
+            tags: dict[int, int] = {}
+            for _ in range(count):
+                tag, field_type, _, value = struct.unpack(
+                    order + entry_format, f.read(struct.calcsize(order + entry_format))
+                )
+                if field_type in TIFF_INTEGER_TYPES:
+                    (tags[tag],) = struct.unpack_from(
+                        order + TIFF_INTEGER_TYPES[field_type], value
+                    )
+            (offset,) = struct.unpack(
+                order + offset_format, f.read(struct.calcsize(order + offset_format))
+            )
+            levels.append(
+                PyramidLevel(
+                    width=tags[256],
+                    height=tags[257],
+                    tile_width=tags.get(322),
+                    tile_height=tags.get(323),
+                )
+            )
+    return levels
+
+
+def jp2_levels(path: Path) -> list[PyramidLevel]:
+    """
+    Derive the resolution levels of a JPEG 2000 file from the image and tile sizes in its SIZ marker and the number of decomposition levels in its COD marker, without decoding the codestream.
+    """
+    with open(path, "rb") as f:
+        # Skip the boxes of a .jp2 wrapper until the contiguous codestream box
+        if f.read(2) != b"\xff\x4f":
+            f.seek(0)
+            while True:
+                length, box_type = struct.unpack(">I4s", f.read(8))
+                header_length = 8
+                if length == 1:
+                    (length,) = struct.unpack(">Q", f.read(8))
+                    header_length = 16
+                if box_type == b"jp2c":
+                    break
+                f.seek(length - header_length, os.SEEK_CUR)
+            if f.read(2) != b"\xff\x4f":
+                raise ValueError(f"{path} does not contain a JPEG 2000 codestream")
+        size: Optional[tuple[int, ...]] = None
+        decompositions: Optional[int] = None
+        while size is None or decompositions is None:
+            marker, length = struct.unpack(">HH", f.read(4))
+            segment = f.read(length - 2)
+            if marker == 0xFF51:
+                size = struct.unpack_from(">6I", segment, 2)
+            elif marker == 0xFF52:
+                decompositions = segment[5]
+            elif marker == 0xFF90:
+                raise ValueError(f"{path} has no SIZ or COD marker in its main header")
+    x, y, x_offset, y_offset, tile_width, tile_height = size
+    return [
+        PyramidLevel(
+            width=ceil((x - x_offset) / 2**r),
+            height=ceil((y - y_offset) / 2**r),
+            tile_width=tile_width,
+            tile_height=tile_height,
+        )
+        for r in range(decompositions + 1)
+    ]
+
+
+def verify_pyramid(manifest: IIIFManifest, pyramid: Path) -> list[str]:
+    """
+    Check that a single-file pyramid holds a level for the full image and for every scale factor in the manifest, each tiled with the manifest's tile size. Level sizes may differ by one pixel, as with tiles.
+    """
+    try:
+        levels = (tiff_levels if pyramid.suffix == ".tif" else jp2_levels)(pyramid)
+    except (KeyError, ValueError, struct.error) as e:
+        return [f"cannot read levels of {pyramid.name}: {e!r}"]
+    errors: list[str] = []
+    tile_scale = manifest.tiles[0] if manifest.tiles else None
+    scale_factors = [1, *(tile_scale.scaleFactors if tile_scale else [])]
+    for sf in sorted(set(scale_factors)):
+        width = ceil(manifest.width / sf)
+        height = ceil(manifest.height / sf)
+        if not any(
+            abs(level.width - width) <= 1 and abs(level.height - height) <= 1
+            for level in levels
+        ):
+            errors.append(f"{pyramid.name} has no {width}x{height} level")
+    if tile_scale is not None:
+        for level in levels:
+            if (level.tile_width, level.tile_height) != (
+                tile_scale.width,
+                tile_scale.width,
+            ):
+                errors.append(
+                    f"{pyramid.name} level {level.width}x{level.height} is not tiled at {tile_scale.width}x{tile_scale.width}"
+                )
+    return errors
+
+
+def scan_directory(directory: Path) -> dict[str, int]:
+    """Return the size of every file in a single directory, or nothing if the directory does not exist"""
+    try:
+        with os.scandir(directory) as entries:
+            return {
+                entry.name: entry.stat().st_size for entry in entries if entry.is_file()
+            }
+    except FileNotFoundError:
+        return {}
+
+
+def read_dimensions(paths: list[Path]) -> dict[Path, tuple[int, int]]:
+    """
+    Read image dimensions from file headers with a single identify -ping call. Files identify cannot read are left out of the result.
+    """
+    identify_stdout = subprocess.run(
+        ["identify", "-ping", "-format", "%w %h %i\n", *paths],
+        capture_output=True,
+    ).stdout.decode("utf-8")
+    dimensions: dict[Path, tuple[int, int]] = {}
+    for line in identify_stdout.splitlines():
+        w, h, filename = line.split(" ", 2)
+        # Multi-frame formats report one line per frame; keep the first
+        dimensions.setdefault(Path(filename), (int(w), int(h)))
+    return dimensions
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_checksum_index(
+    output_dir: Path,
+    workers: int = settings.VERIFY_WORKERS,
+    committer: Optional[OutputCommitter] = None,
+) -> None:
+    """Write a sha256sum-compatible index of every file in an output directory"""
+    index_file = output_dir / settings.CHECKSUM_FILENAME
+    paths = sorted(p for p in output_dir.rglob("*") if p.is_file() and p != index_file)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        digests = pool.map(file_digest, paths)
+        lines = [
+            f"{digest}  {p.relative_to(output_dir).as_posix()}\n"
+            for p, digest in zip(paths, digests)
+        ]
+    (committer or OutputCommitter()).write_text(index_file, "".join(lines))
+
+
+def update_checksum_index(
+    output_dir: Path,
+    paths: list[Path],
+    workers: int = settings.VERIFY_WORKERS,
+    committer: Optional[OutputCommitter] = None,
+) -> None:
+    """Replace the digests of the given files in an existing checksum index, leaving every other entry untouched"""
+    index_file = output_dir / settings.CHECKSUM_FILENAME
+    index: dict[str, str] = {}
+    for line in index_file.read_text().splitlines():
+        if line:
+            digest, name = line.split("  ", 1)
+            index[name] = digest
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for p, digest in zip(paths, pool.map(file_digest, paths)):
+            index[p.relative_to(output_dir).as_posix()] = digest
+    (committer or OutputCommitter()).write_text(
+        index_file,
+        "".join(f"{digest}  {name}\n" for name, digest in sorted(index.items())),
+    )
+
+
+class VerificationReport(BaseModel):
+    expected: int = 0
+    missing: list[Path] = []
+    empty: list[Path] = []
+    bad_dimensions: list[Path] = []
+    bad_checksums: list[Path] = []
+    errors: list[str] = []
+
+    @property
+    def ok(self) -> bool:
+        return not (
+            self.missing
+            or self.empty
+            or self.bad_dimensions
+            or self.bad_checksums
+            or self.errors
+        )
+
+    def __str__(self) -> str:
+        lines = [
+            f"{'OK' if self.ok else 'FAILED'}: checked {self.expected} files",
+            *[f"missing: {p}" for p in self.missing],
+            *[f"empty: {p}" for p in self.empty],
+            *[f"wrong dimensions: {p}" for p in self.bad_dimensions],
+            *[f"checksum mismatch: {p}" for p in self.bad_checksums],
+            *self.errors,
+        ]
+        return "\n".join(lines)
+
+
+def verify_tree(
+    manifest: IIIFManifest,
+    output_dir: Path,
+    report: VerificationReport,
+    pool: ThreadPoolExecutor,
+    check_dimensions: bool,
+) -> None:
+    """Check every tile and size file of a directory tree, listing each directory once and reading dimensions in batches"""
+    expected = expected_files(manifest)
+    report.expected = len(expected)
+    by_directory: dict[Path, list[ExpectedFile]] = defaultdict(list)
+    for ef in expected:
+        by_directory[ef.path.parent].append(ef)
+
+    present: list[ExpectedFile] = []
+    directories = list(by_directory)
+    listings = pool.map(lambda d: scan_directory(output_dir / d), directories)
+    for directory, listing in zip(directories, listings):
+        for ef in by_directory[directory]:
+            size = listing.get(ef.path.name)
+            if size is None:
+                report.missing.append(ef.path)
+            elif size == 0:
+                report.empty.append(ef.path)
+            else:
+                present.append(ef)
+
+    if check_dimensions:
+        chunks = batches(present, settings.VERIFY_BATCH_SIZE)
+        results = pool.map(
+            lambda chunk: read_dimensions([output_dir / ef.path for ef in chunk]),
+            chunks,
+        )
+        for chunk, dimensions in zip(chunks, results):
+            for ef in chunk:
+                found = dimensions.get(output_dir / ef.path)
+                if (
+                    found is None
+                    or abs(found[0] - ef.width) > 1
+                    or abs(found[1] - ef.height) > 1
+                ):
+                    report.bad_dimensions.append(ef.path)
+
+
+def verify(
+    output_dir: Path,
+    source: Optional[Path] = None,
+    check_dimensions: bool = True,
+    check_checksums: bool = False,
+    workers: int = settings.VERIFY_WORKERS,
+) -> VerificationReport:
+    """
+    Verify an output tree against its info.json.
+
+    Each directory holding expected files is listed once, with directories scanned in parallel. Dimensions are read from image headers only, in batches per identify call, and may differ from the expected size by one pixel to allow for ImageMagick's rounding when it preserves aspect ratio.
+
+    An output made with a tif or jp2 output mode is checked as a single pyramid file instead, whose levels and tile geometry are read from the file's own headers.
+    """
+    report = VerificationReport()
+    manifest = IIIFManifest.parse_file(output_dir / "info.json")
+
+    if source is not None:
+        source_dimensions = read_dimensions([source]).get(source)
+        if source_dimensions != (manifest.width, manifest.height):
+            report.errors.append(
+                f"source {source} is {source_dimensions}, but info.json describes {(manifest.width, manifest.height)}"
+            )
+
+    pyramid = find_pyramid(output_dir)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        if pyramid is not None:
+            report.expected = 1
+            if pyramid.stat().st_size == 0:
+                report.empty.append(pyramid.relative_to(output_dir))
+            elif check_dimensions:
+                report.errors += verify_pyramid(manifest, pyramid)
+        else:
+            verify_tree(manifest, output_dir, report, pool, check_dimensions)
+
+        if check_checksums:
+            index_file = output_dir / settings.CHECKSUM_FILENAME
+            if not index_file.exists():
+                report.errors.append(f"checksum index {index_file} not found")
+            else:
+                index = [
+                    line.split("  ", 1)
+                    for line in index_file.read_text().splitlines()
+                    if line
+                ]
+                digests = pool.map(
+                    lambda entry: file_digest(output_dir / entry[1])
+                    if (output_dir / entry[1]).exists()
+                    else None,
+                    index,
+                )
+                for (digest, relative_path), found_digest in zip(index, digests):
+                    if digest != found_digest:
+                        report.bad_checksums.append(Path(relative_path))
+    return report
@@ -0,0 +1,222 @@
+"""
+Watch a drop directory and convert images as they arrive, using a fixed pool of warm worker processes.
+"""
+
+import logging
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel
+
+from magick_tile.aio import run_sync
+from magick_tile.generator import SourceImage
+from magick_tile.scratch import terminate_as_exit
+from magick_tile.settings import IIIFFormats, settings
+
+
+def convert_job(
+    source: Path,
+    output: Path,
+    identifier: str,
+    tile_size: int,
+    formats: list[IIIFFormats],
+) -> float:
+    """Convert a single image inside a worker process, returning the seconds spent encoding. Unlike SourceImage.convert, no progress bars are drawn into the shared terminal."""
+    si = SourceImage(id=identifier, path=source, tile_size=tile_size, target_dir=output, formats=formats)  # type: ignore
+    with terminate_as_exit():
+        return run_sync(si.aconvert()).elapsed
+
+
+def move_atomically(source: Path, target_dir: Path) -> Path:
+    """
+    Move a file into a directory with a single rename. Falls back to a copy when the directory is on another filesystem.
+    """
+    target_dir.mkdir(parents=True, exist_ok=True)
+    target = target_dir / source.name
+    try:
+        os.replace(source, target)
+    except OSError:
+        shutil.move(source, target)
+    return target
+
+
+class WatchStats(BaseModel):
+    started: float
+    queued: int = 0
+    running: int = 0
+    completed: int = 0
+    failed: int = 0
+    encode_seconds: float = 0.0
+    images_per_minute: float = 0.0
+
+    def record(self, elapsed: Optional[float]) -> None:
+        if elapsed is None:
+            self.failed += 1
+        else:
+            self.completed += 1
+            self.encode_seconds += elapsed
+        self.images_per_minute = (
+            60 * self.completed / max(time.time() - self.started, 1e-9)
+        )
+
+    def __str__(self) -> str:
+        return f"queued: {self.queued}, running: {self.running}, completed: {self.completed}, failed: {self.failed}, {self.images_per_minute:.2f} images/min"
+
+
+class DropFolder(BaseModel):
+    input_dir: Path
+    output_dir: Path
+    base_id: str
+    done_dir: Path
+    error_dir: Path
+    tile_size: int = 512
+    formats: list[IIIFFormats] = [IIIFFormats.jpg]
+    workers: int = 2
+    interval: float = 2.0
+    settle: float = 5.0
+    queue_file: Optional[Path] = None
+    queue_offset: int = 0
+    stats_file: Optional[Path] = None
+    crash_retries: int = 2
+
+    def identifier(self, source: Path) -> str:
+        return f"{self.base_id.rstrip('/')}/{source.stem}"
+
+    def is_settled(self, source: Path) -> bool:
+        """Skip files that are still being written, judged by how recently they were modified"""
+        try:
+            return time.time() - source.stat().st_mtime >= self.settle
+        except FileNotFoundError:
+            return False
+
+    def poll(self) -> list[Path]:
+        """
+        List images ready for conversion: settled image files directly inside the input directory, followed by any paths appended to the queue file since the last poll.
+        """
+        found = sorted(
+            Path(entry.path)
+            for entry in os.scandir(self.input_dir)
+            if entry.is_file()
+            and Path(entry.name).suffix.lstrip(".").lower() in settings.WATCH_EXTENSIONS
+            and self.is_settled(Path(entry.path))
+        )
+        if self.queue_file is not None and self.queue_file.exists():
+            with open(self.queue_file, "rb") as queuef:
+                queuef.seek(self.queue_offset)
+                lines = queuef.readlines()
+            # Leave a partially written final line for the next poll
+            if lines and not lines[-1].endswith(b"\n"):
+                lines.pop()
+            self.queue_offset += sum(len(line) for line in lines)
+            found += [
+                Path(line.decode("utf-8").strip()) for line in lines if line.strip()
+            ]
+        return found
+
+    def write_stats(self, stats: WatchStats) -> None:
+        if self.stats_file is not None:
+            tmp_file = self.stats_file.with_name(f".{self.stats_file.name}.tmp")
+            tmp_file.write_text(stats.json(indent=2))
+            os.replace(tmp_file, self.stats_file)
+
+    def run(self, once: bool = False) -> WatchStats:
+        """
+        Convert images as they arrive with at most `workers` conversions in flight. Finished sources are moved to `done_dir` and failed ones to `error_dir`. With `once`, stop when everything currently waiting has been processed.
+
+        If a worker process dies, e.g. when the OOM killer stops the conversion of a very large image, the pool is restarted and the conversions in flight are queued again.
+        """
+        stats = WatchStats(started=time.time())
+        backlog: deque[Path] = deque()
+        known: set[Path] = set()
+        running: dict[Future, Path] = {}
+        crashes: dict[Path, int] = {}
+        pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            while True:
+                for source in self.poll():
+                    if source not in known:
+                        known.add(source)
+                        backlog.append(source)
+                broken = False
+                while backlog and len(running) < self.workers:
+                    source = backlog.popleft()
+                    try:
+                        future = pool.submit(
+                            convert_job,
+                            source,
+                            self.output_dir / source.stem,
+                            self.identifier(source),
+                            self.tile_size,
+                            self.formats,
+                        )
+                    except BrokenProcessPool:
+                        backlog.appendleft(source)
+                        broken = True
+                        break
+                    running[future] = source
+                stats.queued = len(backlog)
+                stats.running = len(running)
+                self.write_stats(stats)
+                if once and not running and not backlog:
+                    return stats
+
+                if not broken:
+                    finished, _ = wait(
+                        running, timeout=self.interval, return_when=FIRST_COMPLETED
+                    )
+                    for future in finished:
+                        if isinstance(future.exception(), BrokenProcessPool):
+                            broken = True
+                            continue
+                        source = running.pop(future)
+                        known.discard(source)
+                        crashes.pop(source, None)
+                        try:
+                            elapsed: Optional[float] = future.result()
+                            move_atomically(source, self.done_dir)
+                            logging.info(f"Converted {source} in {elapsed:.2f}s")
+                        except Exception as e:
+                            elapsed = None
+                            if source.exists():
+                                move_atomically(source, self.error_dir)
+                            logging.error(f"Failed to convert {source}: {e}")
+                        stats.record(elapsed)
+                        logging.info(stats)
+                if broken:
+                    pool = self.restart_pool(pool, running, backlog, crashes, stats)
+                    running = {}
+        finally:
+            pool.shutdown()
+
+    def restart_pool(
+        self,
+        pool: ProcessPoolExecutor,
+        running: dict[Future, Path],
+        backlog: deque[Path],
+        crashes: dict[Path, int],
+        stats: WatchStats,
+    ) -> ProcessPoolExecutor:
+        """
+        Replace a pool broken by a dead worker, putting the conversions that were in flight back at the front of the backlog. Any of them may have caused the crash, so each is charged with one; a source charged with more than `crash_retries` crashes is moved to `error_dir` instead.
+        """
+        logging.warning(
+            f"A worker process died; restarting the pool and re-queueing {len(running)} conversions"
+        )
+        for source in reversed(list(running.values())):
+            crashes[source] = crashes.get(source, 0) + 1
+            if crashes[source] > self.crash_retries:
+                crashes.pop(source)
+                if source.exists():
+                    move_atomically(source, self.error_dir)
+                logging.error(f"Failed to convert {source}: worker process died")
+                stats.record(None)
+            else:
+                backlog.appendleft(source)
+        pool.shutdown(wait=False, cancel_futures=True)
+        return ProcessPoolExecutor(max_workers=self.workers)
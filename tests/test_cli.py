@@ -1,3 +1,5 @@
+import json
+import shutil
 from pathlib import Path
 
 from typer.testing import CliRunner
@@ -10,7 +12,7 @@ runner = CliRunner()
 def test_app(test_jpg: Path, test_output_dir: Path, example_id: str):
     result = runner.invoke(
         app,
-        [str(test_jpg), str(test_output_dir), example_id],
+        ["convert", str(test_jpg), str(test_output_dir), example_id],
     )
     print(result.stdout)
     assert result.exit_code == 0
@@ -23,6 +25,7 @@ def test_multi_output(test_png: Path, test_output_dir: Path, example_id: str):
     result = runner.invoke(
         app,
         [
+            "convert",
             str(test_png),
             str(test_output_dir),
             example_id,
@@ -44,7 +47,7 @@ def test_multi_output(test_png: Path, test_output_dir: Path, example_id: str):
 def test_invalid_file(test_jpg: Path, test_output_dir: Path, example_id: str):
     result = runner.invoke(
         app,
-        [str(test_output_dir), str(test_output_dir), example_id],
+        ["convert", str(test_output_dir), str(test_output_dir), example_id],
     )
     assert "Invalid value for 'SOURCE'" in result.stdout
     assert result.exit_code == 2
@@ -53,7 +56,119 @@ def test_invalid_file(test_jpg: Path, test_output_dir: Path, example_id: str):
 def test_invalid_output(test_jpg: Path, test_output_dir: Path, example_id: str):
     result = runner.invoke(
         app,
-        [str(test_jpg), str(test_jpg), example_id],
+        ["convert", str(test_jpg), str(test_jpg), example_id],
     )
     assert "Invalid value for 'OUTPUT'" in result.stdout
     assert result.exit_code == 2
+
+
+def test_pyramid_output(test_jpg: Path, test_output_dir: Path, example_id: str):
+    result = runner.invoke(
+        app,
+        [
+            "convert",
+            str(test_jpg),
+            str(test_output_dir),
+            example_id,
+            "--output-mode",
+            "tif",
+        ],
+    )
+    print(result.stdout)
+    assert result.exit_code == 0
+    assert (test_output_dir / "info.json").exists()
+    assert (test_output_dir / "image.tif").exists()
+    assert "tif: wrote 2 files" in result.stdout
+
+
+def test_dry_run(test_jpg: Path, test_output_dir: Path, example_id: str):
+    result = runner.invoke(
+        app,
+        ["convert", str(test_jpg), str(test_output_dir), example_id, "--dry-run"],
+    )
+    assert result.exit_code == 0
+    plan = json.loads(result.stdout)
+    assert plan["total_files"] == 11
+    assert len(list(test_output_dir.glob("*"))) == 0
+
+
+def test_watch_once(
+    test_jpg: Path, test_working_dir: Path, test_output_dir: Path, example_id: str
+):
+    shutil.copy(test_jpg, test_working_dir / "image.jpg")
+    result = runner.invoke(
+        app,
+        [
+            "watch",
+            str(test_working_dir),
+            str(test_output_dir),
+            example_id,
+            "--once",
+            "--settle",
+            "0",
+        ],
+    )
+    print(result.stdout)
+    assert result.exit_code == 0
+    assert "completed: 1" in result.stdout
+    assert (test_output_dir / "image" / "info.json").exists()
+    assert (test_working_dir / "done" / "image.jpg").exists()
+
+
+def test_verify(test_jpg: Path, test_output_dir: Path, example_id: str):
+    runner.invoke(app, ["convert", str(test_jpg), str(test_output_dir), example_id])
+    result = runner.invoke(
+        app, ["verify", str(test_output_dir), "--source", str(test_jpg)]
+    )
+    assert result.exit_code == 0
+    assert "OK: checked 10 files" in result.stdout
+
+    (test_output_dir / "full" / "256," / "0" / "default.jpg").unlink()
+    result = runner.invoke(app, ["verify", str(test_output_dir)])
+    assert result.exit_code == 1
+    assert "missing: full/256,/0/default.jpg" in result.stdout
+
+
+def test_update(test_jpg: Path, test_output_dir: Path, example_id: str):
+    runner.invoke(
+        app,
+        ["convert", str(test_jpg), str(test_output_dir), example_id, "--signatures"],
+    )
+    assert (test_output_dir / "signatures.json").exists()
+    result = runner.invoke(app, ["update", str(test_jpg), str(test_output_dir)])
+    assert result.exit_code == 0
+    assert "0 changed cells" in result.stdout
+
+
+def test_progressive(test_jpg: Path, test_output_dir: Path, example_id: str):
+    result = runner.invoke(
+        app,
+        [
+            "convert",
+            str(test_jpg),
+            str(test_output_dir),
+            example_id,
+            "--order",
+            "progressive",
+        ],
+    )
+    assert result.exit_code == 0
+    assert "info.json ready" in result.stdout
+    assert "tiles at scale factor 2 ready" in result.stdout
+
+
+def test_fsync(test_jpg: Path, test_output_dir: Path, example_id: str):
+    result = runner.invoke(
+        app,
+        [
+            "convert",
+            str(test_jpg),
+            str(test_output_dir),
+            example_id,
+            "--fsync",
+            "file",
+        ],
+    )
+    assert result.exit_code == 0
+    assert (test_output_dir / "0,0,1024,1024" / "512," / "0" / "default.jpg").exists()
+    assert list(test_output_dir.rglob(".*")) == []
@@ -1,12 +1,42 @@
+import asyncio
 import json
+import os
+import shutil
+import signal
+import subprocess
+import time
 from pathlib import Path
 
 import pytest
 
 from pytest_subprocess import FakeProcess
-from magick_tile.generator import SourceImage, Tile, DownsizedVersion
+from magick_tile.generator import ConversionLevel, SourceImage, Tile, DownsizedVersion
 from magick_tile.manifest import IIIFManifest, TileScale, TileSize
-from magick_tile.settings import IIIFFormats
+from magick_tile.planner import calibrate, tile_regions
+from magick_tile.settings import (
+    ConversionOrders,
+    FsyncPolicies,
+    IIIFFormats,
+    OutputModes,
+)
+from magick_tile import generator, scratch, watcher
+from magick_tile.aio import (
+    ProgressEvent,
+    run_command,
+    run_stage,
+    run_sync,
+    run_thread,
+)
+from magick_tile import committer
+from magick_tile.committer import OutputCommitter
+from magick_tile.scratch import (
+    InsufficientScratchSpace,
+    ScratchSpace,
+    terminate_as_exit,
+)
+from magick_tile.updater import Rectangle, SignatureIndex, dirty_tiles
+from magick_tile.verifier import expected_files, jp2_levels, tiff_levels, verify
+from magick_tile.watcher import DropFolder
 
 
 @pytest.fixture
@@ -332,3 +362,707 @@ class TestCompleteOutput:
         assert (
             test_output_dir / "0,0,1024,1024" / "512," / "0" / "default.jpg"
         ).exists()
+
+
+class TestPyramidOutput:
+    def test_pyramid_levels(self, example_jpg_image: SourceImage):
+        assert example_jpg_image.pyramid_levels == [1, 2]
+
+    def test_tif_pyramid(self, example_jpg_image: SourceImage, test_output_dir: Path):
+        example_jpg_image.output_mode = OutputModes.tif
+        report = example_jpg_image.convert()
+        assert example_jpg_image.pyramid_file == test_output_dir / "image.tif"
+        assert example_jpg_image.pyramid_file.exists()
+        assert (test_output_dir / "info.json").exists()
+        assert not (test_output_dir / "full").exists()
+        assert report.output_mode == OutputModes.tif
+        assert report.output_files == 2
+        assert report.output_bytes > 0
+
+    def test_jp2_pyramid(self, example_jpg_image: SourceImage, test_output_dir: Path):
+        example_jpg_image.output_mode = OutputModes.jp2
+        report = example_jpg_image.convert()
+        assert example_jpg_image.pyramid_file == test_output_dir / "image.jp2"
+        assert report.output_mode == OutputModes.jp2
+        assert report.output_files == 2
+        levels = jp2_levels(example_jpg_image.pyramid_file)
+        assert [(l.width, l.height) for l in levels] == [(2676, 1572), (1338, 786)]
+        assert all((l.tile_width, l.tile_height) == (512, 512) for l in levels)
+
+    def test_tif_pyramid_levels(self, example_jpg_image: SourceImage):
+        example_jpg_image.output_mode = OutputModes.tif
+        example_jpg_image.convert()
+        levels = tiff_levels(example_jpg_image.pyramid_file)
+        assert [l.width for l in levels] == [2676, 1338]
+        assert all((l.tile_width, l.tile_height) == (512, 512) for l in levels)
+
+    def test_elapsed_excludes_indexing(
+        self, example_jpg_image: SourceImage, monkeypatch: pytest.MonkeyPatch
+    ):
+        def slow_index(*args, **kwargs):
+            time.sleep(3)
+
+        monkeypatch.setattr(generator, "write_checksum_index", slow_index)
+        example_jpg_image.output_mode = OutputModes.tif
+        example_jpg_image.checksums = True
+        assert example_jpg_image.convert().elapsed < 3
+
+    def test_tree_report(self, example_jpg_image: SourceImage):
+        report = example_jpg_image.convert()
+        assert report.output_mode == OutputModes.tree
+        assert report.output_files > 2
+
+
+class TestPlanner:
+    def test_tile_regions(self):
+        regions = tile_regions(width=2676, height=1572, tile_size=512, sf=2)
+        assert len(regions) == 6
+        assert regions[0].path == Path("0,0,1024,1024") / "512," / "0"
+        assert (regions[-1].x, regions[-1].y, regions[-1].w, regions[-1].h) == (
+            2048,
+            1024,
+            628,
+            548,
+        )
+        assert regions[-1].file_w == 314
+        assert regions[-1].file_h == 274
+
+    def test_tile_region_matches_tile(self, example_tile: Tile):
+        assert example_tile.region.path == Path("0,0,512,512") / "256," / "0"
+
+    def test_plan(self, example_jpg_image: SourceImage):
+        plan = example_jpg_image.plan()
+        assert plan.width == 2676
+        assert [level.tiles for level in plan.levels] == [6]
+        assert plan.tile_files == 6
+        assert plan.size_files == 4
+        assert plan.total_files == 11
+        assert plan.output_bytes > 0
+        assert plan.scratch_bytes == max(level.scratch_bytes for level in plan.levels)
+        assert plan.peak_memory_bytes == 2676 * 1572 * 8
+        assert plan.estimated_seconds > 0
+
+    def test_plan_matches_output(
+        self, example_png_image: SourceImage, test_output_dir: Path
+    ):
+        plan = example_png_image.plan()
+        example_png_image.convert()
+        assert plan.total_files == len(
+            [p for p in test_output_dir.rglob("*") if p.is_file()]
+        )
+
+    def test_calibrate(self, test_jpg: Path):
+        coefficients = calibrate(test_jpg, [IIIFFormats.jpg, IIIFFormats.png])
+        assert coefficients.bytes_per_pixel[IIIFFormats.png] > 0
+        assert coefficients.pixels_per_second[IIIFFormats.jpg] > 0
+
+
+@pytest.fixture
+def example_drop_folder(test_working_dir: Path, test_output_dir: Path) -> DropFolder:
+    input_dir = test_working_dir / "incoming"
+    input_dir.mkdir()
+    return DropFolder(
+        input_dir=input_dir,
+        output_dir=test_output_dir,
+        base_id="https://example.com/iiif/",
+        done_dir=test_working_dir / "done",
+        error_dir=test_working_dir / "error",
+        settle=0,
+        interval=0.1,
+    )
+
+
+def crashing_job(source: Path, *args) -> float:
+    """Stand-in for convert_job whose worker is killed on the first attempt at a source named crash*, or on every attempt at one named always_crash*"""
+    marker = source.with_suffix(".crashed")
+    if source.stem == "always_crash" or (
+        source.stem == "crash" and not marker.exists()
+    ):
+        marker.touch()
+        os.kill(os.getpid(), signal.SIGKILL)
+    return 1.0
+
+
+class TestDropFolder:
+    def test_identifier(self, example_drop_folder: DropFolder):
+        assert (
+            example_drop_folder.identifier(Path("/tmp/foo.jpg"))
+            == "https://example.com/iiif/foo"
+        )
+
+    def test_poll(self, example_drop_folder: DropFolder, test_working_dir: Path):
+        (example_drop_folder.input_dir / "a.jpg").write_bytes(b"")
+        (example_drop_folder.input_dir / "notes.txt").write_bytes(b"")
+        queue_file = test_working_dir / "queue.txt"
+        queue_file.write_text("/data/b.tif\n/data/c.t")
+        example_drop_folder.queue_file = queue_file
+        assert example_drop_folder.poll() == [
+            example_drop_folder.input_dir / "a.jpg",
+            Path("/data/b.tif"),
+        ]
+        with open(queue_file, "a") as queuef:
+            queuef.write("if\n")
+        assert example_drop_folder.poll() == [
+            example_drop_folder.input_dir / "a.jpg",
+            Path("/data/c.tif"),
+        ]
+
+    def test_poll_extensions(self, example_drop_folder: DropFolder):
+        names = ["a.tiff", "b.TIF", "c.jpeg", "d.JPG", "e.txt"]
+        for name in names:
+            (example_drop_folder.input_dir / name).write_bytes(b"")
+        assert example_drop_folder.poll() == [
+            example_drop_folder.input_dir / name for name in names[:4]
+        ]
+
+    def test_unsettled(self, example_drop_folder: DropFolder):
+        (example_drop_folder.input_dir / "a.jpg").write_bytes(b"")
+        example_drop_folder.settle = 60
+        assert example_drop_folder.poll() == []
+
+    def test_run_once(
+        self,
+        example_drop_folder: DropFolder,
+        test_jpg: Path,
+        test_output_dir: Path,
+    ):
+        shutil.copy(test_jpg, example_drop_folder.input_dir / "good.jpg")
+        (example_drop_folder.input_dir / "bad.jpg").write_bytes(b"not an image")
+        stats = example_drop_folder.run(once=True)
+        assert stats.completed == 1
+        assert stats.failed == 1
+        assert stats.queued == 0
+        assert (test_output_dir / "good" / "info.json").exists()
+        assert (example_drop_folder.done_dir / "good.jpg").exists()
+        assert (example_drop_folder.error_dir / "bad.jpg").exists()
+        assert list(example_drop_folder.input_dir.glob("*.jpg")) == []
+
+    def test_worker_crash(
+        self, example_drop_folder: DropFolder, monkeypatch: pytest.MonkeyPatch
+    ):
+        monkeypatch.setattr(watcher, "convert_job", crashing_job)
+        for name in ["crash.jpg", "good.jpg", "always_crash.jpg"]:
+            (example_drop_folder.input_dir / name).write_bytes(b"")
+        stats = example_drop_folder.run(once=True)
+        assert stats.completed == 2
+        assert stats.failed == 1
+        assert (example_drop_folder.done_dir / "crash.jpg").exists()
+        assert (example_drop_folder.done_dir / "good.jpg").exists()
+        assert (example_drop_folder.error_dir / "always_crash.jpg").exists()
+
+
+class TestVerifier:
+    def test_expected_files(self, example_manifest_object: IIIFManifest):
+        expected = expected_files(example_manifest_object)
+        assert len(expected) == 31
+        assert expected[-1].path == Path("full") / "512," / "0" / "default.jpg"
+        assert expected[-1].height == 341
+
+    def test_verify(self, example_jpg_image: SourceImage, test_output_dir: Path):
+        example_jpg_image.convert()
+        report = verify(test_output_dir)
+        assert report.ok
+        assert report.expected == 10
+
+        (test_output_dir / "0,0,1024,1024" / "512," / "0" / "default.jpg").unlink()
+        (test_output_dir / "full" / "256," / "0" / "default.jpg").write_bytes(b"")
+        report = verify(test_output_dir)
+        assert not report.ok
+        assert report.missing == [Path("0,0,1024,1024") / "512," / "0" / "default.jpg"]
+        assert report.empty == [Path("full") / "256," / "0" / "default.jpg"]
+
+    def test_verify_dimensions(
+        self, example_jpg_image: SourceImage, test_output_dir: Path, tile_jpg: Path
+    ):
+        example_jpg_image.convert()
+        shutil.copy(
+            tile_jpg, test_output_dir / "0,0,1024,1024" / "512," / "0" / "default.jpg"
+        )
+        assert verify(test_output_dir, check_dimensions=False).ok
+        report = verify(test_output_dir)
+        assert report.bad_dimensions == [
+            Path("0,0,1024,1024") / "512," / "0" / "default.jpg"
+        ]
+
+    def test_verify_source(
+        self,
+        example_jpg_image: SourceImage,
+        test_output_dir: Path,
+        test_jpg: Path,
+        tile_jpg: Path,
+    ):
+        example_jpg_image.write_info()
+        assert (
+            verify(test_output_dir, source=test_jpg, check_dimensions=False).errors
+            == []
+        )
+        assert (
+            verify(test_output_dir, source=tile_jpg, check_dimensions=False).errors
+            != []
+        )
+
+    def test_verify_checksums(
+        self, example_jpg_image: SourceImage, test_output_dir: Path
+    ):
+        example_jpg_image.checksums = True
+        example_jpg_image.convert()
+        assert (test_output_dir / "checksums.sha256").exists()
+        assert verify(test_output_dir, check_checksums=True).ok
+        with open(test_output_dir / "full" / "256," / "0" / "default.jpg", "ab") as f:
+            f.write(b"corrupt")
+        report = verify(test_output_dir, check_checksums=True)
+        assert report.bad_checksums == [Path("full") / "256," / "0" / "default.jpg"]
+
+    def test_verify_pyramid(
+        self, example_jpg_image: SourceImage, test_output_dir: Path, test_jpg: Path
+    ):
+        example_jpg_image.output_mode = OutputModes.tif
+        example_jpg_image.convert()
+        report = verify(test_output_dir)
+        assert report.ok
+        assert report.expected == 1
+
+        subprocess.run(["convert", test_jpg, test_output_dir / "image.tif"], check=True)
+        report = verify(test_output_dir)
+        assert not report.ok
+        assert report.missing == []
+        assert "image.tif has no 1338x786 level" in report.errors
+
+
+@pytest.fixture
+def retouched_png(test_png: Path, tmp_path: Path) -> Path:
+    p = tmp_path / "retouched.png"
+    subprocess.run(
+        [
+            "convert",
+            test_png,
+            "-fill",
+            "red",
+            "-draw",
+            "rectangle 1100,100 1200,200",
+            p,
+        ],
+        check=True,
+    )
+    return p
+
+
+class TestUpdate:
+    def test_changed_cells(self):
+        previous = SignatureIndex(
+            width=2048,
+            height=1024,
+            cell_size=1024,
+            signatures={"0,0,1024,1024": "a", "1024,0,1024,1024": "b"},
+        )
+        current = SignatureIndex(
+            width=2048,
+            height=1024,
+            cell_size=1024,
+            signatures={"0,0,1024,1024": "a", "1024,0,1024,1024": "c"},
+        )
+        assert current.changed_cells(previous) == [
+            Rectangle(x=1024, y=0, w=1024, h=1024)
+        ]
+
+    def test_changed_geometry(self):
+        previous = SignatureIndex(
+            width=2048, height=1024, cell_size=1024, signatures={}
+        )
+        current = SignatureIndex(width=1024, height=1024, cell_size=1024, signatures={})
+        with pytest.raises(Exception):
+            current.changed_cells(previous)
+
+    def test_dirty_tiles(self):
+        dirty = [Rectangle(x=1024, y=0, w=1024, h=1024)]
+        assert [
+            (r.x, r.y) for r in dirty_tiles(tile_regions(4096, 4096, 512, 2), dirty)
+        ] == [(1024, 0)]
+        assert [
+            (r.x, r.y) for r in dirty_tiles(tile_regions(4096, 4096, 512, 4), dirty)
+        ] == [(0, 0)]
+
+    def test_signature_index(self, example_jpg_image: SourceImage):
+        index = SignatureIndex.from_image(
+            example_jpg_image.path, example_jpg_image.cell_size
+        )
+        assert (index.width, index.height) == (2676, 1572)
+        assert len(index.signatures) == 6
+        assert index.changed_cells(index) == []
+
+    def test_update(
+        self,
+        example_png_image: SourceImage,
+        test_output_dir: Path,
+        retouched_png: Path,
+    ):
+        example_png_image.signatures = True
+        example_png_image.checksums = True
+        example_png_image.convert()
+        untouched = test_output_dir / "0,0,1024,1024" / "512," / "0" / "default.jpg"
+        touched = test_output_dir / "1024,0,1024,1024" / "512," / "0" / "default.jpg"
+        untouched_mtime = untouched.stat().st_mtime_ns
+        touched_mtime = touched.stat().st_mtime_ns
+
+        example_png_image.path = retouched_png
+        report = example_png_image.update()
+        assert report.changed_cells == 1
+        assert report.tiles == {2: 1}
+        assert untouched.stat().st_mtime_ns == untouched_mtime
+        assert touched.stat().st_mtime_ns != touched_mtime
+        assert verify(test_output_dir, check_checksums=True).ok
+
+        assert example_png_image.update().changed_cells == 0
+
+    def test_update_from_previous_source(
+        self,
+        example_png_image: SourceImage,
+        test_png: Path,
+        retouched_png: Path,
+    ):
+        example_png_image.convert()
+        example_png_image.path = retouched_png
+        report = example_png_image.update(previous_source=test_png)
+        assert report.tiles == {2: 1}
+
+    def test_update_without_signatures(self, example_png_image: SourceImage):
+        example_png_image.convert()
+        with pytest.raises(Exception):
+            example_png_image.update()
+
+    def test_update_pyramid_refused(self, test_png: Path, test_output_dir: Path):
+        (test_output_dir / "image.tif").write_bytes(b"pyramid")
+        si = SourceImage(id="https://example.com/test.png", path=test_png, tile_size=512, target_dir=test_output_dir)  # type: ignore
+        with pytest.raises(Exception, match="image.tif"):
+            si.update()
+        assert not si.working_dir.exists()
+        assert list(test_output_dir.iterdir()) == [test_output_dir / "image.tif"]
+
+
+@pytest.fixture
+def fake_free_space(monkeypatch: pytest.MonkeyPatch):
+    free: dict[Path, int] = {}
+    monkeypatch.setattr(scratch, "free_space", lambda path: free[path])
+    return free
+
+
+class TestScratchSpace:
+    def test_tmpfs_staging(self, tmp_path: Path, fake_free_space: dict[Path, int]):
+        disk = tmp_path / "disk"
+        tmpfs = tmp_path / "tmpfs"
+        disk.mkdir()
+        tmpfs.mkdir()
+        fake_free_space.update({disk: 10_000, tmpfs: 2_000})
+        space = ScratchSpace(working_dir=disk, tmpfs_dir=tmpfs, fallback_dirs=[])
+        level_dirs = space.allocate({2: 5_000, 4: 500})
+        assert level_dirs[2] == disk
+        assert level_dirs[4].parent == tmpfs
+        space.cleanup()
+        assert not level_dirs[4].exists()
+        assert disk.exists()
+
+    def test_levels_checked_separately(
+        self, tmp_path: Path, fake_free_space: dict[Path, int]
+    ):
+        disk = tmp_path / "disk"
+        tmpfs = tmp_path / "tmpfs"
+        disk.mkdir()
+        tmpfs.mkdir()
+        fake_free_space.update({disk: 7_000, tmpfs: 2_000})
+        space = ScratchSpace(working_dir=disk, tmpfs_dir=tmpfs, fallback_dirs=[])
+        level_dirs = space.allocate({1: 5_000, 2: 5_000, 4: 600, 8: 600})
+        assert level_dirs[1] == level_dirs[2] == disk
+        assert level_dirs[4].parent == level_dirs[8].parent == tmpfs
+
+    def test_fallback(self, tmp_path: Path, fake_free_space: dict[Path, int]):
+        small = tmp_path / "small"
+        big = tmp_path / "big"
+        small.mkdir()
+        big.mkdir()
+        fake_free_space.update({small: 1_000, big: 100_000})
+        space = ScratchSpace(working_dir=small, tmpfs_dir=None, fallback_dirs=[big])
+        level_dirs = space.allocate({2: 5_000, 4: 1_000})
+        assert level_dirs[2] == level_dirs[4]
+        assert level_dirs[2].parent == big
+
+    def test_insufficient(self, tmp_path: Path, fake_free_space: dict[Path, int]):
+        fake_free_space.update({tmp_path: 1_000})
+        space = ScratchSpace(working_dir=tmp_path, tmpfs_dir=None, fallback_dirs=[])
+        with pytest.raises(InsufficientScratchSpace):
+            space.allocate({2: 5_000})
+
+    def test_terminate_as_exit(self):
+        with pytest.raises(SystemExit):
+            with terminate_as_exit():
+                os.kill(os.getpid(), signal.SIGTERM)
+                time.sleep(1)
+
+    def test_convert_cleans_scratch(
+        self, example_jpg_image: SourceImage, test_working_dir: Path
+    ):
+        example_jpg_image.convert()
+        assert list(test_working_dir.glob("*")) == []
+
+    def test_default_working_dir_removed(self, test_jpg: Path, test_output_dir: Path):
+        si = SourceImage(id="https://example.com/test.jpg", path=test_jpg, tile_size=512, target_dir=test_output_dir)  # type: ignore
+        assert si.working_dir.exists()
+        si.convert()
+        assert not si.working_dir.exists()
+
+
+class TestAsync:
+    def test_run_command_failure(self):
+        with pytest.raises(subprocess.CalledProcessError):
+            asyncio.run(run_command(["false"]))
+
+    def test_cancel_kills_child(self):
+        async def cancel_sleep():
+            task = asyncio.create_task(run_command(["sleep", "30"]))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        start = time.perf_counter()
+        asyncio.run(cancel_sleep())
+        assert time.perf_counter() - start < 5
+
+    def test_run_stage_events(self):
+        async def stage() -> list[ProgressEvent]:
+            events: asyncio.Queue = asyncio.Queue()
+            await run_stage("test", [["true"], ["true"]], asyncio.Semaphore(1), events)
+            return [events.get_nowait() for _ in range(events.qsize())]
+
+        events = asyncio.run(stage())
+        assert [(e.stage, e.completed, e.total) for e in events] == [
+            ("test", 1, 2),
+            ("test", 2, 2),
+        ]
+
+    def test_run_stage_concurrency(self):
+        start = time.perf_counter()
+        asyncio.run(run_stage("test", [["sleep", "0.3"]] * 3, concurrency=1))
+        assert time.perf_counter() - start >= 0.9
+
+    def test_run_sync_in_running_loop(self):
+        async def inner() -> int:
+            await asyncio.sleep(0)
+            return 1
+
+        async def outer() -> int:
+            return run_sync(inner())
+
+        assert run_sync(inner()) == 1
+        assert asyncio.run(outer()) == 1
+
+    def test_cancel_waits_for_thread(self):
+        finished = []
+
+        def slow():
+            time.sleep(0.3)
+            finished.append(True)
+
+        async def cancel_thread():
+            task = asyncio.create_task(run_thread(slow))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return list(finished)
+
+        assert asyncio.run(cancel_thread()) == [True]
+
+    def test_run_stage_failure_cancels_stage(self):
+        start = time.perf_counter()
+        with pytest.raises(subprocess.CalledProcessError):
+            asyncio.run(run_stage("test", [["sleep", "30"], ["false"]]))
+        assert time.perf_counter() - start < 5
+
+    def test_aconvert(self, example_jpg_image: SourceImage, test_output_dir: Path):
+        report = asyncio.run(example_jpg_image.aconvert())
+        assert report.output_files == 11
+        assert (test_output_dir / "info.json").exists()
+        assert (test_output_dir / "full" / "1024," / "0" / "default.jpg").exists()
+        assert (
+            test_output_dir / "0,0,1024,1024" / "512," / "0" / "default.jpg"
+        ).exists()
+
+    def test_aconvert_progress(
+        self, example_jpg_image: SourceImage, test_working_dir: Path
+    ):
+        async def collect() -> list[ProgressEvent]:
+            return [e async for e in example_jpg_image.aconvert_progress()]
+
+        events = asyncio.run(collect())
+        assert [e.stage for e in events] == ["tiles"] + ["resize"] * 6 + ["sizes"] * 4
+        assert list(test_working_dir.glob("*")) == []
+
+
+class TestProgressiveOrder:
+    def test_progressive_levels(self, example_jpg_image: SourceImage):
+        assert [(l.kind, l.value) for l in example_jpg_image.progressive_levels] == [
+            ("size", 256),
+            ("size", 512),
+            ("size", 1024),
+            ("tiles", 2),
+            ("size", 2048),
+        ]
+
+    def test_agenerate_tiles(
+        self,
+        example_jpg_image: SourceImage,
+        test_output_dir: Path,
+        test_working_dir: Path,
+    ):
+        asyncio.run(example_jpg_image.agenerate_tiles(2))
+        assert (
+            test_output_dir / "0,0,1024,1024" / "512," / "0" / "default.jpg"
+        ).exists()
+        assert list(test_working_dir.glob("*")) == []
+        assert example_jpg_image.tiles == []
+
+    def test_progressive_convert(
+        self, example_jpg_image: SourceImage, test_output_dir: Path
+    ):
+        completed: list[ConversionLevel] = []
+
+        def on_level(level: ConversionLevel):
+            assert (test_output_dir / "info.json").exists()
+            if level.kind == "tiles":
+                assert (
+                    test_output_dir / "0,0,1024,1024" / "512," / "0" / "default.jpg"
+                ).exists()
+                assert not (
+                    test_output_dir / "full" / "2048," / "0" / "default.jpg"
+                ).exists()
+            completed.append(level)
+
+        example_jpg_image.order = ConversionOrders.progressive
+        report = example_jpg_image.convert(on_level=on_level)
+        assert [l.kind for l in completed] == [
+            "info",
+            "size",
+            "size",
+            "size",
+            "tiles",
+            "size",
+        ]
+        assert report.output_files == 11
+
+    def test_progressive_aconvert(
+        self, example_jpg_image: SourceImage, test_output_dir: Path
+    ):
+        completed: list[ConversionLevel] = []
+        example_jpg_image.order = ConversionOrders.progressive
+        report = asyncio.run(example_jpg_image.aconvert(on_level=completed.append))
+        assert [l.kind for l in completed] == [
+            "info",
+            "size",
+            "size",
+            "size",
+            "tiles",
+            "size",
+        ]
+        assert report.output_files == 11
+
+
+@pytest.fixture
+def fsynced(monkeypatch: pytest.MonkeyPatch) -> list[Path]:
+    synced: list[Path] = []
+    monkeypatch.setattr(committer, "fsync_path", synced.append)
+    return synced
+
+
+@pytest.fixture
+def synced_filesystems(monkeypatch: pytest.MonkeyPatch) -> list[Path]:
+    synced: list[Path] = []
+    monkeypatch.setattr(committer, "sync_filesystem", synced.append)
+    return synced
+
+
+def write_temp(c: OutputCommitter, final: Path) -> Path:
+    temp = c.temp_path(final)
+    temp.write_bytes(b"tile")
+    return temp
+
+
+class TestOutputCommitter:
+    def test_temp_path(self, tmp_path: Path):
+        temp = OutputCommitter().temp_path(tmp_path / "default.jpg")
+        assert temp.parent == tmp_path
+        assert temp.name.startswith(".")
+        assert temp.suffix == ".jpg"
+
+    def test_prepare_once(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        c = OutputCommitter()
+        d = tmp_path / "0,0,512,512" / "256," / "0"
+        c.prepare([d, d])
+        assert d.is_dir()
+        d.rmdir()
+        c.prepare([d])
+        assert not d.exists()
+
+    def test_no_fsync(self, tmp_path: Path, fsynced: list[Path]):
+        c = OutputCommitter(fsync=FsyncPolicies.none)
+        final = tmp_path / "default.jpg"
+        temp = write_temp(c, final)
+        c.commit(final)
+        assert final.read_bytes() == b"tile"
+        assert not temp.exists()
+        assert fsynced == []
+
+    def test_file_fsync(self, tmp_path: Path, fsynced: list[Path]):
+        c = OutputCommitter(fsync=FsyncPolicies.file)
+        final = tmp_path / "default.jpg"
+        temp = write_temp(c, final)
+        c.commit(final)
+        assert final.exists()
+        assert fsynced == [temp, tmp_path]
+
+    def test_level_fsync(
+        self,
+        tmp_path: Path,
+        fsynced: list[Path],
+        synced_filesystems: list[Path],
+    ):
+        c = OutputCommitter(fsync=FsyncPolicies.level)
+        finals = [
+            tmp_path / f"{x},0,512,512" / "512," / "0" / "default.jpg"
+            for x in range(0, 2048, 512)
+        ]
+        c.prepare(final.parent for final in finals)
+        for final in finals:
+            write_temp(c, final)
+            c.commit(final)
+        assert not any(final.exists() for final in finals)
+        c.flush()
+        assert all(final.exists() for final in finals)
+        assert fsynced == []
+        assert len(synced_filesystems) == 2
+        c.flush()
+        assert len(synced_filesystems) == 2
+
+    def test_discard(self, tmp_path: Path, synced_filesystems: list[Path]):
+        c = OutputCommitter(fsync=FsyncPolicies.level)
+        final = tmp_path / "default.jpg"
+        write_temp(c, final)
+        c.commit(final)
+        c.discard()
+        c.flush()
+        assert list(tmp_path.iterdir()) == []
+
+    def test_write_text(self, tmp_path: Path, synced_filesystems: list[Path]):
+        c = OutputCommitter(fsync=FsyncPolicies.level)
+        final = tmp_path / "nested" / "info.json"
+        c.write_text(final, "{}")
+        assert final.read_text() == "{}"
+        assert synced_filesystems == [final.parent, final.parent]
+        assert c.pending == []
+
+    def test_level_fsync_convert(
+        self, example_jpg_image: SourceImage, test_output_dir: Path
+    ):
+        example_jpg_image.committer = OutputCommitter(fsync=FsyncPolicies.level)
+        report = example_jpg_image.convert()
+        assert report.output_files == 11
+        assert list(test_output_dir.rglob(".*")) == []